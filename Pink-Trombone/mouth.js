@@ -1,4 +1,9 @@
 const ws = new WebSocket("ws://localhost:5678/");
+ws.binaryType = "arraybuffer";
+// frames of pynktrombone/protocol.py: version, kind, record count, records
+const PROTOCOL_VERSION = 1;
+const HEADER_SIZE = 4;
+const PARAM_COUNT = 9;
 var recorder, wav, buffer;
 function prepareMouth() {
     pinkTromboneElement.pinkTrombone.context = pinkTromboneElement.pinkTrombone.audioContext
@@ -19,25 +24,44 @@ function prepareMouth() {
         say({ index: randomNumber(6, 35), diameter: randomNumber(1, 5) }, { index: randomNumber(-50, 50), diameter: randomNumber(-1, 35) }, randomNumber(0, 5), randomNumber(0.2, 3), randomNumber(0, 1), randomNumber(0, 1), randomNumber(20, 1000)).then(shutUp)
     })
 };
-function sendData() {
+function sendData(job) {
     recorder.getBuffer(e => buffer = e);
     recorder.exportWAV(e => {
         wav = e
         wav.arrayBuffer().then(e => {
-            ws.send("S")
-            ws.send(e)
+            // "S" frame: one job, then the WAV file
+            const frame = new Uint8Array(HEADER_SIZE + 4 + e.byteLength);
+            const view = new DataView(frame.buffer);
+            view.setUint8(0, PROTOCOL_VERSION);
+            view.setUint8(1, "S".charCodeAt(0));
+            view.setUint16(2, 1, true);
+            view.setUint32(HEADER_SIZE, job, true);
+            frame.set(new Uint8Array(e), HEADER_SIZE + 4);
+            ws.send(frame);
         })
     });
     recorder.clear();
 }
+ws.onopen = function () {
+    // register as a renderer; the server sends one job at a time
+    ws.send("B");
+};
 ws.onmessage = async function (event) {
-    if (event.data[0] == "M") {
-        params = event.data.split('|').map(Number);
+    if (!(event.data instanceof ArrayBuffer)) return;
+    const view = new DataView(event.data);
+    if (view.getUint8(0) != PROTOCOL_VERSION) {
+        console.log("unsupported protocol version " + view.getUint8(0));
+        return;
+    }
+    if (String.fromCharCode(view.getUint8(1)) == "M") {
+        // the server sends one record per frame: job, then float32 parameters
+        const job = view.getUint32(HEADER_SIZE, true);
+        params = Array.from({ length: PARAM_COUNT }, (_, k) => view.getFloat32(HEADER_SIZE + 4 + 4 * k, true));
         recorder.record();
         await say({ index: params[0], diameter: params[1] }, { index: params[2], diameter: params[3] }, params[4], params[5], params[6], params[7], params[8]);
         recorder.stop();
         shutUp();
-        sendData();
+        sendData(job);
     }
 };
 
@@ -0,0 +1,78 @@
+"""
+Accuracy and throughput of the frequency-domain tract model.
+
+For a few voices, compares pynktrombone.formants.spectral_envelope with the
+spectrum of the settled tract's impulse response as Tract.compute_block
+renders it (the largest difference in dB below 0.95 x Nyquist), then times
+transfer_function and formants on batches of random tongue and lip shapes.
+
+Run from the repository root: python -m benchmarks.formants
+"""
+from timeit import default_timer
+
+import numpy as np
+
+from pynktrombone.voc import Voc
+from pynktrombone.formants import formants, shape_diameters, spectral_envelope, transfer_function
+
+# name: (sample rate, tract parameters)
+VOICES = {
+    'neutral': (8000, dict()),
+    'vowel_a': (16000, dict(tongue_index=12.9, tongue_diameter=2.4, lips=1.5)),
+    'nasal': (8000, dict(tongue_index=30, tongue_diameter=1.8, velum=0.4, lips=0.9)),
+    'vowel_u': (44100, dict(tongue_index=22, tongue_diameter=2.0, lips=0.6)),
+}
+IMPULSE_LENGTH = 1 << 15
+BATCHES = (1000, 20000)
+N_FREQS = (64, 256)
+
+
+def impulse_response(sr, tract_parameters) -> Voc:
+    vocal = Voc(sr, backend='block')
+    vocal.set_tract_parameters(**tract_parameters)
+    vocal.render(sr)  # let the tract settle on its targets
+    tract = vocal.tract
+    tract.clear()
+    glottal, out = np.zeros(IMPULSE_LENGTH), np.zeros(IMPULSE_LENGTH)
+    glottal[0] = 1
+    for start in range(0, IMPULSE_LENGTH, vocal.control_interval):
+        block = slice(start, start + vocal.control_interval)
+        tract.calculate_reflections()
+        tract.compute_block(glottal[block], out[block])
+    return vocal, out
+
+
+def accuracy(name) -> float:
+    sr, tract_parameters = VOICES[name]
+    vocal, response = impulse_response(sr, tract_parameters)
+    measured = 20 * np.log10(np.abs(np.fft.rfft(response)) + 1e-20)
+    freqs, envelope = spectral_envelope(vocal.current_tract_diameters, vocal.nose_diameters[0], sr,
+                                        IMPULSE_LENGTH // 2 + 1, vocal.tract)
+    band = (freqs > 0) & (freqs < 0.95 * sr / 2)
+    return float(np.abs(measured - envelope[0])[band].max())
+
+
+def random_shapes(count, seed=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return shape_diameters(rng.uniform(12, 30, count), rng.uniform(1, 3.5, count), rng.uniform(0.2, 1.5, count))
+
+
+def main() -> None:
+    print(f'{"voice":<10} {"sr":>6} {"max error dB":>13}')
+    for name, (sr, _) in VOICES.items():
+        print(f'{name:<10} {sr:>6} {accuracy(name):>13.2g}')
+
+    print()
+    print(f'{"function":<20} {"shapes":>7} {"n_freqs":>8} {"ms":>9} {"shapes/s":>11}')
+    for count in BATCHES:
+        diameters = random_shapes(count)
+        for n_freqs in N_FREQS:
+            for function in (transfer_function, formants):
+                start = default_timer()
+                function(diameters, 0.01, 16000, n_freqs=n_freqs)
+                seconds = default_timer() - start
+                print(f'{function.__name__:<20} {count:>7} {n_freqs:>8} {seconds * 1e3:>9.1f} {count / seconds:>11,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Golden-output regression check for the synthesis engine.
+
+benchmarks/golden.npz holds reference renders of a few voices, made with the
+'reference' backend. Every backend and engine layout listed in VARIANTS, and
+a VocBatch of each size in BATCH_SIZES, must reproduce them to within
+TOLERANCE. A change that is meant to alter the
+audio must bump voc.SYNTH_VERSION and regenerate the file with --update.
+
+Run from the repository root: python -m benchmarks.golden [--update]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from pynktrombone.batch import VocBatch
+from pynktrombone.timeline import Timeline
+from pynktrombone.voc import BACKENDS, DEFAULT_SEED, SYNTH_VERSION, Voc
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden.npz')
+
+# Largest absolute sample difference allowed against a golden render. Output
+# peaks around 0.3, so this only admits floating-point reassociation.
+TOLERANCE = 1e-9
+
+WORD = Timeline.from_segments([
+    (0.15, dict(tongue_index=12.9, tongue_diameter=2.4, lips=1.5, velum=0.01, frequency=140, tenseness=0.6)),
+    (0.10, dict(tongue_index=20, tongue_diameter=2.0, lips=0.0, velum=0.01, frequency=150, tenseness=0.6)),
+    (0.15, dict(tongue_index=25, tongue_diameter=1.2, lips=1.2, velum=0.01, frequency=170, tenseness=0.8)),
+    (0.20, dict(tongue_index=20, tongue_diameter=3.0, lips=1.0, velum=0.5, frequency=120, tenseness=0.4)),
+])
+
+# name: (sample rate, seconds, tract parameters, frequency, timeline)
+CASES = {
+    'neutral_8k': (8000, 0.5, dict(), 140, None),
+    'vowel_16k': (16000, 0.25, dict(tongue_index=12.9, tongue_diameter=2.4, lips=1.5), 220, None),
+    'nasal_8k': (8000, 0.5, dict(tongue_index=30, tongue_diameter=1.8, velum=0.4, lips=0.9), 110, None),
+    'vowel_44k': (44100, 0.1, dict(tongue_index=25, tongue_diameter=1.0, lips=1.2), 300, None),
+    'word_8k': (8000, WORD.duration, None, None, WORD),
+}
+
+# Voc keyword arguments that must not change the audio.
+VARIANTS = [dict(backend=backend) for backend in BACKENDS] + [
+    dict(backend='block', block_size=1024, control_interval=512),
+]
+
+# Voices per VocBatch. The golden voice is voice 0; the others speak a
+# different vowel so the stacked state is exercised.
+BATCH_SIZES = (1, 3)
+OTHER_VOICE = dict(tongue_index=30, tongue_diameter=1.8, velum=0.4, lips=0.9)
+
+
+def render_case(name, **voc_kwargs) -> np.ndarray:
+    sr, duration, tract_parameters, frequency, timeline = CASES[name]
+    vocal = Voc(sr, **voc_kwargs)
+    if timeline is not None:
+        return vocal.render_controls(timeline.compile(sr, vocal.control_interval))
+    vocal.set_tract_parameters(**tract_parameters)
+    vocal.frequency = frequency
+    return vocal.render(int(sr * duration))
+
+
+def render_batch_case(name, n_voices) -> np.ndarray:
+    sr, duration, tract_parameters, frequency, timeline = CASES[name]
+    batch = VocBatch(n_voices, sr)
+    golden_voice = batch.voices[0]
+    golden_voice.reseed(DEFAULT_SEED)  # the seed a standalone Voc gets
+    for k, vocal in enumerate(batch.voices[1:]):
+        vocal.set_tract_parameters(**OTHER_VOICE)
+        vocal.frequency = 100 + 30 * k
+    if timeline is not None:
+        # one control period per block, as Voc.render_controls applies them
+        assert batch.control_interval == batch.block_size
+        controls = timeline.compile(sr, batch.control_interval)
+        blocks = []
+        for k in range(controls.n_periods):
+            controls.apply(golden_voice, k)
+            blocks.append(batch.play_chunk()[0])
+        return np.concatenate(blocks)
+    golden_voice.set_tract_parameters(**tract_parameters)
+    golden_voice.frequency = frequency
+    n_samples = int(sr * duration)
+    n_blocks = -(-n_samples // batch.block_size)
+    return np.concatenate([batch.play_chunk()[0] for _ in range(n_blocks)])[:n_samples]
+
+
+def update() -> None:
+    goldens = {name: render_case(name, backend='reference') for name in CASES}
+    np.savez_compressed(GOLDEN_PATH, synth_version=SYNTH_VERSION, **goldens)
+    print(f'wrote {len(goldens)} golden renders to {GOLDEN_PATH}')
+
+
+def check() -> bool:
+    """Render every case with every variant and report the worst error against its golden."""
+    goldens = np.load(GOLDEN_PATH)
+    if int(goldens['synth_version']) != SYNTH_VERSION:
+        print(f'golden renders are for SYNTH_VERSION {int(goldens["synth_version"])}, '
+              f'the engine is {SYNTH_VERSION}: regenerate them with --update')
+        return False
+
+    ok = True
+    for name in CASES:
+        golden = goldens[name]
+        renders = [(', '.join(f'{k}={v}' for k, v in variant.items()), render_case, variant)
+                   for variant in VARIANTS]
+        renders += [(f'VocBatch, n_voices={n}', render_batch_case, dict(n_voices=n)) for n in BATCH_SIZES]
+        for label, render, kwargs in renders:
+            audio = render(name, **kwargs)
+            error = np.abs(audio - golden).max() if audio.shape == golden.shape else np.inf
+            passed = error <= TOLERANCE
+            ok &= passed
+            print(f'{"ok  " if passed else "FAIL"} {name:<12} {label:<50} max error {error:.3g}')
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--update', action='store_true',
+                        help='regenerate the golden renders with the reference backend')
+    args = parser.parse_args()
+    if args.update:
+        update()
+    else:
+        sys.exit(0 if check() else 1)
+
+
+if __name__ == '__main__':
+    main()
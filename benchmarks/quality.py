@@ -0,0 +1,99 @@
+"""
+Spectral error and speed of the draft quality tier against full quality.
+
+For each voice, renders the same articulation at both tiers (block backend)
+and compares the long-term average spectra after a warm-up: the RMS
+log-spectral distance in dB between 50 Hz and 0.9 x Nyquist, and the first
+three formants estimated by LPC. "seed" is the distance between two
+full-quality renders that differ only in their noise seed, the spread that
+aspiration noise alone causes.
+
+Measured at SYNTH_VERSION 2 (python -m benchmarks.quality):
+
+    voice          sr  LSD dB  seed dB  F1-F3 full (Hz)   F1-F3 draft (Hz)  speedup
+    neutral      8000    2.68     1.49    332   891  1467   318   877  2009    1.9x
+    vowel_i     16000    0.30     1.05    235  1134  1895   235  1127  1880    1.9x
+    vowel_a     16000    2.73     1.07   1141  1813  2310  1138  1770  2414    1.9x
+    nasal        8000    5.36     1.44    124   911  1876   122   857  1831    2.0x
+    vowel_u     44100    5.11     0.62    294  1664  2523   299  1650  2505    1.7x
+
+F1 and F2 stay within about 5% (LPC picks an extra peak for neutral's F3).
+Most of the distance is above half the Nyquist frequency, where the 22-section
+waveguide has less resolution, and in the nasal coupling, as the velum joins
+the half-resolution tract one section off. Draft renders are good enough to
+rank screening candidates; re-render finalists at full quality.
+
+Run from the repository root: python -m benchmarks.quality
+"""
+from timeit import default_timer
+
+import numpy as np
+
+from pynktrombone.voc import Voc
+
+# name: (sample rate, tract parameters, frequency)
+VOICES = {
+    'neutral': (8000, dict(), 140),
+    'vowel_i': (16000, dict(tongue_index=27, tongue_diameter=1.6, lips=1.5), 220),
+    'vowel_a': (16000, dict(tongue_index=12.9, tongue_diameter=2.4, lips=1.5), 180),
+    'nasal': (8000, dict(tongue_index=30, tongue_diameter=1.8, velum=0.4, lips=0.9), 110),
+    'vowel_u': (44100, dict(tongue_index=22, tongue_diameter=2.0, lips=0.6), 150),
+}
+SECONDS = 1.0
+WARM_UP = 0.1
+FRAME = 1024
+
+
+def render(name, quality, seed=0):
+    sr, tract_parameters, frequency = VOICES[name]
+    vocal = Voc(sr, backend='block', quality=quality, seed=seed)
+    vocal.set_tract_parameters(**tract_parameters)
+    vocal.frequency = frequency
+    start = default_timer()
+    audio = vocal.render(int(sr * (SECONDS + WARM_UP)))
+    return audio[int(sr * WARM_UP):], default_timer() - start
+
+
+def average_spectrum(audio: np.ndarray) -> np.ndarray:
+    """Welch estimate of the power spectrum in dB (Hann frames, 50% overlap)."""
+    window = np.hanning(FRAME)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME)[::FRAME // 2]
+    power = np.mean(np.abs(np.fft.rfft(frames * window, axis=1)) ** 2, axis=0)
+    return 10 * np.log10(power + 1e-20)
+
+
+def log_spectral_distance(a: np.ndarray, b: np.ndarray, sr: float) -> float:
+    freqs = np.fft.rfftfreq(FRAME, 1 / sr)
+    band = (freqs >= 50) & (freqs <= 0.9 * sr / 2)
+    return float(np.sqrt(np.mean((average_spectrum(a)[band] - average_spectrum(b)[band]) ** 2)))
+
+
+def formants(audio: np.ndarray, sr: float, count=3) -> np.ndarray:
+    """Lowest ``count`` formant frequencies from an autocorrelation LPC fit."""
+    order = 2 + int(sr / 1000)
+    x = np.append(audio[0], audio[1:] - 0.63 * audio[:-1]) * np.hamming(len(audio))
+    r = np.correlate(x, x, 'full')[len(x) - 1:len(x) + order]
+    toeplitz = r[np.abs(np.subtract.outer(np.arange(order), np.arange(order)))]
+    a = np.linalg.solve(toeplitz, -r[1:order + 1])
+    roots = np.roots(np.concatenate(([1.0], a)))
+    roots = roots[np.imag(roots) > 0]
+    freqs = np.sort(np.angle(roots) * sr / (2 * np.pi))
+    return freqs[freqs > 90][:count]
+
+
+def main() -> None:
+    print(f'{"voice":<10} {"sr":>6} {"LSD dB":>7} {"seed dB":>8}  {"F1-F3 full (Hz)":<17} '
+          f'{"F1-F3 draft (Hz)":<17} {"speedup":>7}')
+    for name, (sr, _, _) in VOICES.items():
+        full, full_time = render(name, 'full')
+        draft, draft_time = render(name, 'draft')
+        reseeded, _ = render(name, 'full', seed=1)
+        f_full = ' '.join(f'{f:5.0f}' for f in formants(full, sr))
+        f_draft = ' '.join(f'{f:5.0f}' for f in formants(draft, sr))
+        print(f'{name:<10} {sr:>6} {log_spectral_distance(full, draft, sr):>7.2f} '
+              f'{log_spectral_distance(full, reseeded, sr):>8.2f}  {f_full:<17} {f_draft:<17} '
+              f'{full_time / draft_time:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Microbenchmark for the per-block reflection interpolation tables in Tract.
+
+Times the coefficient interpolation that Tract.compute_block used to do inline
+on every one of its 1024 sub-steps against building the tables once per block
+(and reusing them while the tract is at rest), then times a whole block.
+
+Run from the repository root: python -m benchmarks.reflection_tables
+"""
+from timeit import timeit
+
+import numpy as np
+
+from pynktrombone.voc import Voc
+
+BLOCK = 512
+REPEAT = 50
+
+
+def inline_interpolation(tract, n_samples=BLOCK) -> None:
+    """The interpolation compute_block did on each sub-step before the tables."""
+    n = tract.n
+    reflection = tract.reflection[1:n]
+    new_reflection = tract.new_reflection[1:n]
+    r = np.empty(n - 1)
+    w = np.empty(n - 1)
+    for i in range(n_samples):
+        for lmbd in (float(i) / n_samples, float(i + 0.5) / n_samples):
+            np.multiply(reflection, 1 - lmbd, out=r)
+            np.multiply(new_reflection, lmbd, out=w)
+            np.add(r, w, out=r)
+            tract.new_reflection_left * (1 - lmbd) + tract.reflection_left * lmbd
+            tract.new_reflection_right * (1 - lmbd) + tract.reflection_right * lmbd
+            tract.new_reflection_nose * (1 - lmbd) + tract.reflection_nose * lmbd
+
+
+def table_interpolation(tract, n_samples=BLOCK, rebuild=True) -> None:
+    """Build (or reuse) the tables and read every sub-step row, as compute_block does."""
+    if rebuild:
+        tract.calculate_interpolation_tables(n_samples)
+    table = tract.reflection_table[:, 1:tract.n]
+    left = tract.reflection_left_table.tolist()
+    right = tract.reflection_right_table.tolist()
+    nose = tract.reflection_nose_table.tolist()
+    for k in range(2 * n_samples):
+        table[k], left[k], right[k], nose[k]
+
+
+def main() -> None:
+    voc = Voc(8000, backend='block')
+    voc.set_tract_parameters(tongue_index=15, tongue_diameter=2.5, lips=0.8)
+    voc.render(4 * BLOCK)
+    tract = voc.tract
+    glottal = np.zeros(BLOCK)
+    out = np.zeros(BLOCK)
+
+    def per_block(f) -> float:
+        return timeit(f, number=REPEAT) / REPEAT * 1e3
+
+    inline = per_block(lambda: inline_interpolation(tract))
+    rebuilt = per_block(lambda: table_interpolation(tract))
+    cached = per_block(lambda: table_interpolation(tract, rebuild=False))
+    whole = per_block(lambda: tract.compute_block(glottal, out))
+
+    print(f'reflection interpolation per {BLOCK}-sample block')
+    print(f'  inline, every sub-step:   {inline:7.3f} ms')
+    print(f'  tables, rebuilt:          {rebuilt:7.3f} ms  (saves {inline - rebuilt:.3f} ms)')
+    print(f'  tables, reused at rest:   {cached:7.3f} ms  (saves {inline - cached:.3f} ms)')
+    print(f'Tract.compute_block total:  {whole:7.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Throughput benchmark for the synthesis engine.
+
+Reports samples per second for the glottis, the tract waveguide, tract
+reshaping, the transient pool and whole Voc renders on every backend, across
+sample rates and durations. Check renders against the golden outputs with
+benchmarks.golden before trusting a speedup.
+
+Run from the repository root: python -m benchmarks.synthesis [--quick]
+"""
+import argparse
+from timeit import repeat
+
+import numpy as np
+
+from pynktrombone.voc import BACKENDS, BLOCK_SIZE, Voc
+from pynktrombone.transient import TransientPool  # after voc, which it imports
+
+SAMPLE_RATES = (8000, 16000, 44100)
+DURATIONS = (0.1, 1.0)
+
+
+def best_of(f, number, repeats) -> float:
+    """Best wall time of one call of ``f`` over ``repeats`` runs of ``number`` calls."""
+    return min(repeat(f, number=number, repeat=repeats)) / number
+
+
+def speaking_voc(sr, backend='block') -> Voc:
+    vocal = Voc(sr, backend=backend)
+    vocal.set_tract_parameters(tongue_index=15, tongue_diameter=2.5, lips=0.8, velum=0.2)
+    vocal.frequency = 160
+    vocal.render(4 * BLOCK_SIZE)  # let the tract settle on its targets
+    return vocal
+
+
+def components(sr, repeats):
+    """(name, seconds per sample) for each engine component at ``sr``."""
+    vocal = speaking_voc(sr)
+    glottis, tract = vocal.glottis, vocal.tract
+    glottal = np.zeros(BLOCK_SIZE)
+    out = np.zeros(BLOCK_SIZE)
+
+    def per_sample_glottis():
+        for i in range(BLOCK_SIZE):
+            glottis.compute(i / BLOCK_SIZE)
+
+    def per_sample_tract():
+        for i in range(BLOCK_SIZE):
+            tract.compute(0.0, i / BLOCK_SIZE)
+            tract.compute(0.0, (i + 0.5) / BLOCK_SIZE)
+
+    def moving_reshape():
+        # alternate the lips so every reshape has somewhere to move
+        tract.lips = 0.0 if tract.lips > 0.5 else 1.5
+        tract.reshape()
+
+    pool = TransientPool()
+    L, R = np.zeros(tract.n), np.zeros(tract.n)
+
+    def transients():
+        for i in range(BLOCK_SIZE):
+            if not pool.size:
+                pool.append(tract.lip_start)
+            pool.inject(L, R, tract.T * 0.5)
+            pool.inject(L, R, tract.T * 0.5)
+
+    # Reshape runs once per block, so its cost is spread over a block of samples.
+    return [
+        ('Glottis.compute', best_of(per_sample_glottis, 1, repeats) / BLOCK_SIZE),
+        ('Glottis.compute_block', best_of(lambda: glottis.compute_block(glottal), 5, repeats) / BLOCK_SIZE),
+        ('Tract.compute', best_of(per_sample_tract, 1, repeats) / BLOCK_SIZE),
+        ('Tract.compute_block', best_of(lambda: tract.compute_block(glottal, out), 5, repeats) / BLOCK_SIZE),
+        ('Tract.reshape', best_of(moving_reshape, 50, repeats) / BLOCK_SIZE),
+        ('TransientPool.inject', best_of(transients, 1, repeats) / BLOCK_SIZE),
+    ]
+
+
+def renders(sr, duration, repeats):
+    """(backend, seconds per sample) for a Voc render of ``duration`` seconds at ``sr``."""
+    n_samples = int(sr * duration)
+    results = []
+    for backend in BACKENDS:
+        vocal = speaking_voc(sr, backend)
+        results.append((backend, best_of(lambda: vocal.render(n_samples), 1, repeats) / n_samples))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true',
+                        help='one sample rate, the shortest duration and fewer repeats')
+    args = parser.parse_args()
+    sample_rates = SAMPLE_RATES[:1] if args.quick else SAMPLE_RATES
+    durations = DURATIONS[:1] if args.quick else DURATIONS
+    repeats = 1 if args.quick else 3
+
+    print(f'{"component":<24} {"sr":>6} {"samples/s":>12}')
+    for sr in sample_rates:
+        for name, seconds in components(sr, repeats):
+            print(f'{name:<24} {sr:>6} {1 / seconds:>12,.0f}')
+
+    print()
+    print(f'{"Voc.render":<24} {"sr":>6} {"duration":>8} {"samples/s":>12} {"x realtime":>10}')
+    for sr in sample_rates:
+        for duration in durations:
+            for backend, seconds in renders(sr, duration, repeats):
+                print(f'{backend:<24} {sr:>6} {duration:>7}s {1 / seconds:>12,.0f} {1 / (seconds * sr):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
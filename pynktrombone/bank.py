@@ -0,0 +1,306 @@
+import argparse
+import io
+import json
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writer per bank
+    fcntl = None
+
+DEFAULT_BANK_DIR = 'mouth_sounds'
+BANK_VERSION = 1
+# Every sound starts on this byte boundary, so its samples map aligned.
+_ALIGN = 16
+
+
+class BankEntry(NamedTuple):
+    key: str
+    offset: int  # bytes into the sample file
+    length: int  # samples
+    dtype: str
+    sample_rate: Optional[float]
+    params: object
+
+
+class SoundBank:
+    """
+    Append-only store of mono sounds in `directory`: one sample file, memory
+    mapped for reads, and an index with one JSON line of (key, offset, length,
+    dtype, sample rate, parameters) per sound after a header line that names
+    the sample file.
+
+    Samples are flushed before their index lines are written, so a crash can
+    leave samples no entry refers to (compact reclaims them) but never an
+    entry without its samples. A key may be appended again; lookups return
+    its latest entry. Appends and compaction hold an exclusive lock where
+    fcntl is available, so several processes may share a bank, and every
+    lookup first reads the entries other processes appended since.
+    """
+    def __init__(self, directory=DEFAULT_BANK_DIR):
+        self.directory = directory
+        self._index_path = os.path.join(directory, 'index.jsonl')
+        self._entries: Dict[str, BankEntry] = {}
+        self._samples_path = None
+        self._map = None
+        self._inode = None
+        self._position = 0
+        self._torn = False
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            if not os.path.exists(self._index_path):
+                open(os.path.join(directory, _samples_name(0)), 'ab').close()
+                self._write_index(_samples_name(0), [])
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return self.entry(key) is not None
+
+    def keys(self):
+        return self._entries.keys()
+
+    def entry(self, key: str) -> Optional[BankEntry]:
+        self.refresh()  # cheap: reads only the index lines appended since
+        return self._entries.get(key)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Samples of the latest sound stored under `key`, or None. The array is a
+        read-only view into the mapped sample file.
+        """
+        entry = self.entry(key)
+        if entry is None:
+            return None
+        if entry.length == 0:
+            return np.zeros(0, entry.dtype)
+        end = entry.offset + entry.length * np.dtype(entry.dtype).itemsize
+        if self._map is None or len(self._map) < end:
+            # the file grew since it was mapped
+            try:
+                self._map = np.memmap(self._samples_path, dtype=np.uint8, mode='r')
+            except FileNotFoundError:  # replaced by another process's compaction
+                self.refresh()
+                return self.get(key)
+        return self._map[entry.offset:end].view(entry.dtype)
+
+    def append(self, key: str, samples: np.ndarray, sample_rate=None, params=None) -> BankEntry:
+        return self.append_many([(key, samples, sample_rate, params)])[0]
+
+    def append_many(self, sounds: Iterable[Tuple[str, np.ndarray, Optional[float], object]]) -> List[BankEntry]:
+        """
+        Store (key, samples, sample_rate, params) sounds with one write to the
+        sample file and one to the index. int16 samples are kept as they are
+        and anything else as float32; `params` must be JSON serialisable.
+        """
+        sounds = [(key, _mono(samples), sample_rate, params) for key, samples, sample_rate, params in sounds]
+        with self._locked():
+            self.refresh()  # another process may have appended or compacted
+            entries, chunks = [], []
+            with open(self._samples_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for key, samples, sample_rate, params in sounds:
+                    padding = -offset % _ALIGN
+                    offset += padding
+                    chunks += [bytes(padding), samples.tobytes()]
+                    entries.append(BankEntry(key, offset, len(samples), samples.dtype.str, sample_rate, params))
+                    offset += samples.nbytes
+                f.write(b''.join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path, 'ab') as f:
+                # finish a line a crashed writer left half written; refresh skips it
+                f.write((b'\n' if self._torn else b'') + b''.join(_line(entry._asdict()) for entry in entries))
+            self.refresh()
+        return entries
+
+    def refresh(self) -> None:
+        """
+        Read the index lines written since the last refresh, or the whole index
+        if the bank was compacted in the meantime.
+        """
+        with open(self._index_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._position:
+                self._entries, self._map, self._inode, self._position = {}, None, stat.st_ino, 0
+            f.seek(self._position)
+            self._torn = False
+            for line in f:
+                if not line.endswith(b'\n'):
+                    self._torn = True  # being written, or left by a crash
+                    break
+                self._position += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'version' in record:
+                    assert record['version'] == BANK_VERSION, \
+                        f'Sound bank version {record["version"]} is not {BANK_VERSION}'
+                    self._samples_path = os.path.join(self.directory, record['samples'])
+                else:
+                    entry = BankEntry(**record)
+                    self._entries[entry.key] = entry
+
+    def compact(self) -> int:
+        """
+        Rewrite the bank with only the latest sound of every key, dropping
+        superseded sounds and unreferenced samples, and return the number of
+        bytes reclaimed.
+
+        The new sample file replaces the old one by an atomic switch of the
+        index; other processes move to it at their next lookup. The old file is
+        deleted where the OS allows deleting a mapped file, otherwise at the
+        next compaction.
+        """
+        with self._locked():
+            self.refresh()
+            before = os.path.getsize(self._samples_path)
+            generation = int(os.path.basename(self._samples_path).split('-')[1].split('.')[0]) + 1
+            samples_path = os.path.join(self.directory, _samples_name(generation))
+            entries = []
+            with open(samples_path, 'wb') as f:
+                offset = 0
+                for entry in sorted(self._entries.values(), key=lambda entry: entry.offset):
+                    samples = self.get(entry.key)
+                    padding = -offset % _ALIGN
+                    f.write(bytes(padding))
+                    offset += padding
+                    entries.append(entry._replace(offset=offset))
+                    f.write(samples.tobytes())
+                    offset += samples.nbytes
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_index(_samples_name(generation), entries)
+            self._map = None
+            self.refresh()
+            for name in os.listdir(self.directory):
+                if name.startswith('samples-') and name != _samples_name(generation):
+                    try:
+                        os.unlink(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+        return before - offset
+
+    @property
+    def stats(self) -> dict:
+        return dict(sounds=len(self._entries), bytes=os.path.getsize(self._samples_path))
+
+    def _write_index(self, samples_name: str, entries: List[BankEntry]) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_line(dict(version=BANK_VERSION, samples=samples_name)))
+                f.write(b''.join(_line(entry._asdict()) for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._index_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'lock'), 'wb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+
+def import_directories(bank: SoundBank, directory: str) -> int:
+    """
+    Append the sounds of the old one-directory-per-utterance layout,
+    `directory/<key>[_<timestamp>]/<name>.{npy,wav,pickle}`, and return how
+    many were imported. Each directory's .npy is read if it has one, else its
+    .wav (which needs scipy), else its pickled list of samples. The
+    directories are left in place.
+    """
+    sounds = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name, name)
+        sample_rate = None
+        if os.path.isfile(path + '.npy'):
+            samples = np.load(path + '.npy')
+        elif os.path.isfile(path + '.wav'):
+            with open(path + '.wav', 'rb') as f:
+                sample_rate, samples = decode_wav(f.read())
+        elif os.path.isfile(path + '.pickle'):
+            with open(path + '.pickle', 'rb') as f:
+                samples = np.asarray(pickle.load(f))
+        else:
+            continue
+        sounds.append((name.split('_')[0], samples, sample_rate, None))
+    bank.append_many(sounds)
+    return len(sounds)
+
+
+def decode_wav(data: bytes) -> tuple:
+    """
+    Sample rate and samples of the first channel of a WAV file held in
+    memory, as int16 (16-bit files) or float32. The channel is a view into
+    the decoded frames, not a copy, unless it has to be converted. Needs
+    scipy.
+    """
+    from scipy.io import wavfile
+
+    sample_rate, samples = wavfile.read(io.BytesIO(data))
+    if samples.ndim == 2:
+        samples = samples[:, 0]
+    if samples.dtype == np.uint8:
+        samples = (samples.astype(np.float32) - 128) / 128
+    elif samples.dtype.kind == 'i' and samples.dtype != np.int16:
+        samples = samples.astype(np.float32) / 2 ** (8 * samples.dtype.itemsize - 1)
+    elif samples.dtype.kind == 'f':
+        samples = samples.astype(np.float32, copy=False)
+    return sample_rate, samples
+
+
+def _samples_name(generation: int) -> str:
+    return f'samples-{generation}.bin'
+
+
+def _mono(samples) -> np.ndarray:
+    samples = np.asarray(samples)
+    assert samples.ndim == 1, f'Sounds are mono, got shape {samples.shape}'
+    if samples.dtype != np.int16:
+        samples = samples.astype(np.float32, copy=False)
+    return np.ascontiguousarray(samples)
+
+
+def _line(record: dict) -> bytes:
+    return (json.dumps(record, separators=(',', ':'), default=_plain) + '\n').encode('utf-8')
+
+
+def _plain(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f'Cannot store {type(value).__name__} in a sound bank index')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Maintain a sound bank.')
+    parser.add_argument('command', choices=('compact', 'import', 'stats'))
+    parser.add_argument('--bank', default=DEFAULT_BANK_DIR, help='bank directory')
+    parser.add_argument('--source', help='directory of per-utterance sound directories to import')
+    args = parser.parse_args()
+    bank = SoundBank(args.bank)
+    if args.command == 'compact':
+        print(f'reclaimed {bank.compact():,} bytes')
+    elif args.command == 'import':
+        assert args.source, '--source is required to import'
+        print(f'imported {import_directories(bank, args.source)} sounds')
+    print(', '.join(f'{k} {v:,}' for k, v in bank.stats.items()))
+
+
+if __name__ == '__main__':
+    main()
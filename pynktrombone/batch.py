@@ -0,0 +1,233 @@
+from typing import List, Union
+
+import numpy as np
+
+from pynktrombone import voc
+from pynktrombone.glottis import TENSENESS_STEPS, waveform_coefficients
+from pynktrombone.voc import Voc
+
+# Tract arrays that VocBatch stacks into (n_voices, len) matrices. Each voice's
+# Tract keeps a row view into them, so reshape/calculate_reflections and the
+# transient pools keep working on the shared state in place.
+STACKED_TRACT_STATE = (
+    'L', 'R', 'junction_outL', 'junction_outR',
+    'noseL', 'noseR', 'nose_junc_outL', 'nose_junc_outR',
+    'reflection', 'new_reflection', 'nose_reflection', 'diameter',
+)
+
+
+class VocBatch:
+    """
+    Renders many voices at once over stacked tract and glottis state.
+
+    Every voice is an ordinary :class:`~pynktrombone.voc.Voc` whose Tract arrays
+    are rows of the batch matrices, so per-voice parameters are set exactly as
+    for a single voice (``batch.voices[k].set_tract_parameters(...)``,
+    ``batch.voices[k].frequency = ...``). The glottal source of all voices is
+    held as length-N vectors and both the glottis and the waveguide advance all
+    voices together with one set of NumPy operations per sample.
+
+    Voice ``k`` is seeded with ``SeedSequence(seed).spawn(n_voices)[k]`` and draws
+    its noise from its own generator, so it renders the same audio as a
+    ``Voc(sr, seed=that_child)`` on its own, to within
+    ``benchmarks.golden.TOLERANCE``: the pulse shape comes from the same cached
+    coefficients, but the batch evaluates it with vectorized exp and sin, which
+    differ in the last bits (below 1e-15 measured). ``block_size`` and
+    ``control_interval`` have the same meaning as on Voc.
+    """
+    def __init__(self, n_voices: int, sr: float = 44100,
+                 seed: Union[int, np.random.SeedSequence] = voc.DEFAULT_SEED,
+                 block_size: int = voc.BLOCK_SIZE, control_interval: int = None):
+        assert n_voices > 0, 'VocBatch needs at least one voice'
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.n_voices: int = n_voices
+        self.voices: List[Voc] = [Voc(sr, seed=child, block_size=block_size, control_interval=control_interval)
+                                  for child in seed.spawn(n_voices)]
+        self.block_size: int = self.voices[0].block_size
+        self.control_interval: int = self.voices[0].control_interval
+        self.T: float = 1.0 / sr
+
+        for name in STACKED_TRACT_STATE:
+            stacked = np.stack([getattr(v.tract, name) for v in self.voices])
+            setattr(self, name, stacked)
+            for k, v in enumerate(self.voices):
+                setattr(v.tract, name, stacked[k])
+
+        tract = self.voices[0].tract
+        self.n: int = tract.n
+        self.nose_length: int = tract.nose_length
+        self.nose_start: int = tract.nose_start
+
+        # Glottis state, one entry per voice.
+        # float even though the default frequency is the int 140, or assigned
+        # frequencies would be truncated
+        self.freq: np.ndarray = np.array([v.glottis.freq for v in self.voices], dtype=float)
+        self.tenseness: np.ndarray = np.array([v.glottis.tenseness for v in self.voices], dtype=float)
+        self.time_in_waveform: np.ndarray = voc.zeros(n_voices)
+        self.waveform_length: np.ndarray = voc.zeros(n_voices)
+        self.alpha: np.ndarray = voc.zeros(n_voices)
+        self.E0: np.ndarray = voc.zeros(n_voices)
+        self.epsilon: np.ndarray = voc.zeros(n_voices)
+        self.shift: np.ndarray = voc.zeros(n_voices)
+        self.delta: np.ndarray = voc.zeros(n_voices)
+        self.Te: np.ndarray = voc.zeros(n_voices)
+        self.omega: np.ndarray = voc.zeros(n_voices)
+        self.setup_waveform(np.ones(n_voices, dtype=bool))
+
+        self.buf: np.ndarray = np.zeros((n_voices, self.block_size))
+        self._glottal: np.ndarray = np.zeros((n_voices, self.control_interval))
+        self._noise: np.ndarray = np.zeros((n_voices, self.control_interval))
+        self._r: np.ndarray = np.zeros((n_voices, self.n - 1))
+        self._w: np.ndarray = np.zeros((n_voices, self.n - 1))
+        self._nose_w: np.ndarray = np.zeros((n_voices, self.nose_length - 1))
+
+    def setup_waveform(self, mask: np.ndarray) -> None:
+        """Glottis.setup_waveform for the voices selected by ``mask``, from the same
+        cached coefficients of the quantized tenseness."""
+        for k in np.flatnonzero(mask):
+            self.waveform_length[k] = 1.0 / self.freq[k]
+            (self.alpha[k], self.E0[k], self.epsilon[k], self.shift[k],
+             self.delta[k], self.Te[k], self.omega[k]) = waveform_coefficients(
+                round(self.tenseness[k] * TENSENESS_STEPS))
+
+    def compute_glottis(self, out: np.ndarray) -> None:
+        """Fill ``out`` (n_voices, control_interval) with the glottal source of every voice."""
+        time_in_waveform = self.time_in_waveform
+        waveform_length = self.waveform_length
+        noise = self._noise
+        # Disabled voices draw no noise and their clocks stand still, as in Glottis.
+        enabled = np.array([v.glottis.enable for v in self.voices])
+        T = self.T * enabled
+        for k, v in enumerate(self.voices):
+            if enabled[k]:
+                v.rng.random(out=noise[k])
+        noise *= 2.0
+        noise -= 1
+        aspiration = 1.0 * (1 - np.sqrt(self.tenseness)) * 0.3
+
+        for i in range(out.shape[1]):
+            time_in_waveform += T
+            wrapped = time_in_waveform > waveform_length
+            if wrapped.any():
+                time_in_waveform[wrapped] -= waveform_length[wrapped]
+                self.setup_waveform(wrapped)
+
+            t = time_in_waveform / waveform_length
+            closing = t > self.Te
+            opening = self.E0 * np.exp(self.alpha * t) * np.sin(self.omega * t)
+            falling = (-np.exp(-self.epsilon * (t - self.Te)) + self.shift) / self.delta
+            out[:, i] = np.where(closing, falling, opening) + aspiration * noise[:, i] * 0.2
+        out[~enabled] = 0.0
+
+    def compute_block(self) -> None:
+        """Render the next block of all voices into ``buf``, reshaping every voice
+        once per control period."""
+        for start in range(0, self.block_size, self.control_interval):
+            period = self.buf[:, start:start + self.control_interval]
+            sounding = 0
+            for k, v in enumerate(self.voices):
+                v.tract.reshape()
+                v.tract.calculate_reflections()
+                self.freq[k] = v.glottis.freq
+                self.tenseness[k] = v.glottis.tenseness
+                if not v.glottis.enable and v.tract.is_silent():
+                    # zeroed state scatters to exact zeros, as Voc's fast path emits
+                    v.tract.clear()
+                else:
+                    sounding += 1
+
+            if not sounding:
+                period.fill(0.0)
+                continue
+            self.compute_glottis(self._glottal)
+            self._scatter(self._glottal, period)
+
+    def _scatter(self, glottal: np.ndarray, out: np.ndarray) -> None:
+        # Batched counterpart of Tract.compute_block: same arithmetic per voice,
+        # with the nose junction scalars promoted to length-N vectors.
+        n = self.n
+        nose_length = self.nose_length
+        i_nose = self.nose_start
+        n_samples = out.shape[1]
+        tracts = [v.tract for v in self.voices]
+
+        L, R = self.L, self.R
+        junction_outL, junction_outR = self.junction_outL, self.junction_outR
+        noseL, noseR = self.noseL, self.noseR
+        nose_junc_outL, nose_junc_outR = self.nose_junc_outL, self.nose_junc_outR
+        r, w, nose_w = self._r, self._w, self._nose_w
+
+        reflection = self.reflection[:, 1:n]
+        new_reflection = self.new_reflection[:, 1:n]
+        R_lo, L_hi = R[:, :n - 1], L[:, 1:n]
+        jR_mid, jL_mid = junction_outR[:, 1:n], junction_outL[:, 1:n]
+        jR_lo, jL_hi = junction_outR[:, :n], junction_outL[:, 1:n + 1]
+        nose_reflection = self.nose_reflection[:, 1:nose_length]
+        noseR_lo, noseL_hi = noseR[:, :nose_length - 1], noseL[:, 1:nose_length]
+        njR_mid, njL_mid = nose_junc_outR[:, 1:nose_length], nose_junc_outL[:, 1:nose_length]
+        njR_lo, njL_hi = nose_junc_outR[:, :nose_length], nose_junc_outL[:, 1:nose_length + 1]
+
+        glottal_reflection = np.array([t.glottal_reflection for t in tracts])
+        lip_reflection = np.array([t.lip_reflection for t in tracts])
+        reflection_left = np.array([t.reflection_left for t in tracts])
+        new_reflection_left = np.array([t.new_reflection_left for t in tracts])
+        reflection_right = np.array([t.reflection_right for t in tracts])
+        new_reflection_right = np.array([t.new_reflection_right for t in tracts])
+        reflection_nose = np.array([t.reflection_nose for t in tracts])
+        new_reflection_nose = np.array([t.new_reflection_nose for t in tracts])
+        sounding = [t for t in tracts if t.tpool.size]
+
+        for i in range(n_samples):
+            _in = glottal[:, i]
+            vocal_output = 0
+            for lmbd in (float(i) / n_samples, float(i + 0.5) / n_samples):
+                for t in sounding:
+                    if t.tpool.size:
+                        t.tpool.inject(t.L, t.R, t.T * 0.5)
+
+                junction_outR[:, 0] = L[:, 0] * glottal_reflection + _in
+                junction_outL[:, n] = R[:, n - 1] * lip_reflection
+
+                np.multiply(reflection, 1 - lmbd, out=r)
+                np.multiply(new_reflection, lmbd, out=w)
+                np.add(r, w, out=r)
+                np.add(R_lo, L_hi, out=w)
+                np.multiply(r, w, out=w)
+                np.subtract(R_lo, w, out=jR_mid)
+                np.add(L_hi, w, out=jL_mid)
+
+                rl = new_reflection_left * (1 - lmbd) + reflection_left * lmbd
+                junction_outL[:, i_nose] = rl * R[:, i_nose - 1] + (1 + rl) * (noseL[:, 0] + L[:, i_nose])
+                rr = new_reflection_right * (1 - lmbd) + reflection_right * lmbd
+                junction_outR[:, i_nose] = rr * L[:, i_nose] + (1 + rr) * (R[:, i_nose - 1] + noseL[:, 0])
+                rn = new_reflection_nose * (1 - lmbd) + reflection_nose * lmbd
+                nose_junc_outR[:, 0] = rn * noseL[:, 0] + (1 + rn) * (L[:, i_nose] + R[:, i_nose - 1])
+
+                np.multiply(jR_lo, 0.999, out=R)
+                np.multiply(jL_hi, 0.999, out=L)
+
+                nose_junc_outL[:, nose_length] = noseR[:, nose_length - 1] * lip_reflection
+
+                np.add(noseR_lo, noseL_hi, out=nose_w)
+                np.multiply(nose_reflection, nose_w, out=nose_w)
+                np.subtract(noseR_lo, nose_w, out=njR_mid)
+                np.add(noseL_hi, nose_w, out=njL_mid)
+
+                np.copyto(noseR, njR_lo)
+                np.copyto(noseL, njL_hi)
+
+                vocal_output = vocal_output + (R[:, n - 1] + noseR[:, nose_length - 1])
+            out[:, i] = vocal_output * 0.125
+
+        for k, t in enumerate(tracts):
+            t.lip_output = R[k, n - 1]
+            t.nose_output = noseR[k, nose_length - 1]
+
+    def play_chunk(self) -> np.ndarray:
+        """Render the next block of every voice.
+
+        :return: array of shape (n_voices, block_size)
+        """
+        self.compute_block()
+        return self.buf.copy()
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from pynktrombone.voc import SYNTH_VERSION
+
+DEFAULT_CACHE_DIR = 'render_cache'
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB
+# Eviction frees space down to this fraction of max_bytes, so the directory is
+# walked once per many puts rather than on every put of a full cache.
+LOW_WATER = 0.9
+
+
+def render_key(params: dict, sample_rate=None, synth=SYNTH_VERSION, **extra) -> str:
+    """
+    Content address of a render: SHA-256 of the canonical JSON of the
+    parameters, the synth version and the sample rate.
+
+    Numbers are normalised to float (so 1, 1.0 and np.float32(1) agree) and
+    keys are sorted, so the key does not depend on formatting or dict order.
+    `extra` holds anything else the audio depends on, such as the seed.
+    """
+    document = dict(extra, params=params, sample_rate=sample_rate, synth=synth)
+    canonical = json.dumps(_canonical(document), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': _canonical(value.entropy), 'spawn_key': list(value.spawn_key)}
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, np.integer)) and abs(int(value)) >= 2 ** 53:
+        return str(int(value))  # seeds and entropy: keep every digit
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    raise TypeError(f'Cannot build a render key from {type(value).__name__}')
+
+
+class RenderCache:
+    """
+    Shared on-disk cache of rendered audio, addressed by render_key.
+
+    Entries live in `directory/<key[:2]>/<key><suffix>`. Writes go to a
+    temporary file that is atomically renamed into place, so several
+    processes may share one directory. Reads refresh an entry's mtime and the
+    least recently used entries are evicted once the directory grows past
+    `max_bytes`, down to LOW_WATER of it. `hits`, `misses` and `evictions`
+    count this instance's lookups.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(stat.st_size for _, stat in self._entries())
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Cached audio for `key`, or None.
+        """
+        data = self.get_bytes(key, suffix='.npy')
+        return None if data is None else np.load(io.BytesIO(data))
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(audio))
+        self.put_bytes(key, buffer.getvalue(), suffix='.npy')
+
+    def get_bytes(self, key: str, suffix='.bin') -> Optional[bytes]:
+        """
+        Cached payload for `key`, or None. Used for audio that is not an array,
+        such as WAV files recorded by the browser synth.
+        """
+        path = self._path(key, suffix)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:  # never stored, or evicted by another process
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put_bytes(self, key: str, data: bytes, suffix='.bin') -> None:
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._size += len(data) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the cache fits in LOW_WATER of
+        max_bytes.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        self._size = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if self._size <= LOW_WATER * self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            self._size -= stat.st_size
+
+    @property
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, bytes=self._size)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,226 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+from pynktrombone.voc import Voc
+from pynktrombone.timeline import REGIONS, TRACT_LENGTH, tongue_diameters
+from pynktrombone.tract import Tract
+
+# Value added before taking logs of magnitudes, about -400 dB.
+_TINY = 1e-20
+# Shapes times frequencies solved per pass of _response.
+_CHUNK = 1 << 15
+
+
+def shape_diameters(tongue_index, tongue_diameter, lips=1.5, trachea=0.6, epiglottis=1.1) -> np.ndarray:
+    """
+    Settled tract diameters for batches of articulations, shape (len, 44).
+
+    Arguments broadcast against each other and default like
+    Voc.set_tract_parameters; a Voc given the same parameters reshapes
+    towards exactly these diameters.
+    """
+    tongue_index, tongue_diameter, lips, trachea, epiglottis = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(x, dtype=float))
+          for x in (tongue_index, tongue_diameter, lips, trachea, epiglottis)))
+    diameters = np.empty((tongue_index.shape[0], TRACT_LENGTH))
+    values = dict(trachea=trachea, epiglottis=epiglottis, lips=lips)
+    for name, region in REGIONS:
+        if name == 'tongue':
+            diameters[:, region] = tongue_diameters(tongue_index, tongue_diameter)
+        else:
+            diameters[:, region] = values[name][:, None]
+    return diameters
+
+
+def transfer_function(diameters, velum=0.01, sample_rate: float = 44100, n_freqs: int = 256,
+                      tract: Optional[Tract] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Steady-state frequency response of the waveguide, from glottal source to
+    lip plus nose output, for a batch of tract shapes.
+
+    Solves the same scattering network Tract.compute steps through (junction
+    reflections, the three-way nose junction at ``nose_start``, the fixed
+    nose, lip and glottal reflections and per-step damping) with 2x2 chain
+    matrices, one frequency per column, all shapes at once.
+
+    :param diameters: tract diameters, shape (n,) or (batch, n), e.g.
+        ``Voc.current_tract_diameters`` or :func:`shape_diameters`
+    :param velum: diameter of the first nose section (``nose_diameters[0]``),
+        scalar or one per shape
+    :param sample_rate: sample rate of the Voc the response describes
+    :param n_freqs: number of frequencies from 0 to Nyquist
+    :param tract: Tract whose constants (length, nose, oversampling) to use,
+        a default full-quality Tract if not given
+    :return: frequencies (n_freqs,) and complex responses (batch, n_freqs)
+    """
+    tract = tract if tract is not None else _default_tract()
+    freqs = np.linspace(0, sample_rate / 2, n_freqs)
+    advance = np.exp(2j * np.pi * freqs / (tract.oversampling * sample_rate))
+    return freqs, _response(diameters, velum, advance, tract) * advance
+
+
+def spectral_envelope(diameters, velum=0.01, sample_rate: float = 44100, n_freqs: int = 256,
+                      tract: Optional[Tract] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Magnitude response in dB of a Voc with the given shapes, from glottal
+    samples to output samples: the waveguide's response with each glottal
+    sample held for every step of its output sample, the steps summed, and
+    the images the step rate folds below Nyquist. Matches the spectrum of
+    the tract's impulse response.
+    """
+    tract = tract if tract is not None else _default_tract()
+    steps = tract.oversampling
+    freqs = np.linspace(0, sample_rate / 2, n_freqs)
+    aliases = (freqs + sample_rate * np.arange(steps)[:, None]).ravel()
+    advance = np.exp(2j * np.pi * aliases / (steps * sample_rate))
+    hold = sum(advance ** -k for k in range(steps))
+    mix = sum(advance ** k for k in range(steps))
+    if steps == 1:
+        mix = mix + 1 / advance  # Tract.previous_output
+    response = _response(diameters, velum, advance, tract) * (0.125 * hold * mix * advance)
+    response = response.reshape(-1, steps, n_freqs).sum(axis=1) / steps
+    return freqs, 20 * np.log10(np.abs(response) + _TINY)
+
+
+def formants(diameters, velum=0.01, sample_rate: float = 44100, count: int = 4, n_freqs: int = 512,
+             tract: Optional[Tract] = None) -> np.ndarray:
+    """
+    Lowest ``count`` resonance frequencies (Hz) of each tract shape, shape
+    (batch, count), NaN where a shape has fewer peaks below Nyquist.
+
+    Peaks of :func:`transfer_function` refined by parabolic interpolation.
+    """
+    freqs, response = transfer_function(diameters, velum, sample_rate, n_freqs, tract)
+    magnitude = 20 * np.log10(np.abs(response) + _TINY)
+    peak = np.zeros(magnitude.shape, dtype=bool)
+    peak[:, 1:-1] = (magnitude[:, 1:-1] > magnitude[:, :-2]) & (magnitude[:, 1:-1] >= magnitude[:, 2:])
+    rank = np.cumsum(peak, axis=1)
+    rows, cols = np.nonzero(peak & (rank <= count))
+
+    before, at, after = magnitude[rows, cols - 1], magnitude[rows, cols], magnitude[rows, cols + 1]
+    curvature = before - 2 * at + after
+    offset = np.divide(0.5 * (before - after), curvature, out=np.zeros_like(at), where=curvature != 0)
+    result = np.full((magnitude.shape[0], count), np.nan)
+    result[rows, rank[rows, cols] - 1] = freqs[cols] + offset * (freqs[1] - freqs[0])
+    return result
+
+
+def voc_formants(vocal: Voc, count: int = 4, n_freqs: int = 512) -> np.ndarray:
+    """Formants of a Voc's current tract shape, shape (count,)."""
+    return formants(vocal.current_tract_diameters, vocal.nose_diameters[0], vocal.sr,
+                    count, n_freqs, vocal.tract)[0]
+
+
+def _response(diameters, velum, advance: np.ndarray, tract: Tract) -> np.ndarray:
+    # Glottal source to lip plus nose output at the frequencies where one
+    # waveguide step is ``advance``, up to the step delay transfer_function
+    # adds. Walking from the lips (R[n-1] = 1) to the glottis, each section
+    # multiplies the right and left waves by diag(advance / d, d / advance)
+    # and each junction by [[1, r], [r, 1]] / (1 - r). Keeping the common
+    # factors advance / d and 1 / (1 - r) aside, the waves on either side of
+    # the nose junction are polynomials in q = (d / advance) ** 2 that are
+    # built once per shape and evaluated with a matrix product; only the
+    # three-way nose junction is solved frequency by frequency.
+    diameters = np.atleast_2d(np.asarray(diameters, dtype=float))
+    batch, n = diameters.shape
+    assert n == tract.n, f'Diameters have {n} sections, the tract has {tract.n}'
+    velum = np.broadcast_to(np.asarray(velum, dtype=float), (batch,))
+
+    into_nose, from_nose = _nose_chain(tract, advance)
+    steps = advance / tract.damping
+    q = 1 / (steps * steps)
+    powers = np.power.outer(q, np.arange(n - tract.nose_start + 1)).T.copy()
+    # Shapes per pass, so the per-frequency arrays stay in cache.
+    chunk = max(1, _CHUNK // advance.shape[0])
+    return np.concatenate([
+        _scatter(diameters[k:k + chunk], velum[k:k + chunk], tract, steps, powers, into_nose, from_nose)
+        for k in range(0, batch, chunk)])
+
+
+def _scatter(diameters: np.ndarray, velum: np.ndarray, tract: Tract, steps: np.ndarray, powers: np.ndarray,
+             into_nose: np.ndarray, from_nose: np.ndarray) -> np.ndarray:
+    batch, n = diameters.shape
+    i_nose = tract.nose_start
+
+    # Tract.calculate_reflections
+    A = diameters * diameters
+    closed = A[:, 1:] == 0
+    reflection = np.full((batch, n - 1), 0.999)  # junction i in column i - 1
+    np.divide(A[:, :-1] - A[:, 1:], A[:, :-1] + A[:, 1:], out=reflection, where=~closed)
+    noseA = velum * velum
+    _sum = A[:, i_nose] + A[:, i_nose + 1] + noseA
+    reflection_left = ((2 * A[:, i_nose] - _sum) / _sum)[:, None]
+    reflection_right = ((2 * A[:, i_nose + 1] - _sum) / _sum)[:, None]
+    reflection_nose = ((2 * noseA - _sum) / _sum)[:, None]
+
+    # Lip side: R[i_nose - 1] and L[i_nose] arriving at the nose junction.
+    right, left = np.zeros((batch, n - i_nose + 1)), np.zeros((batch, n - i_nose + 1))
+    right[:, 0] = 1
+    left[:, 1] = tract.lip_reflection
+    for i in range(n - 1, i_nose, -1):
+        r = reflection[:, i - 1:i]
+        right, left = right + r * left, r * right + left
+        left = np.roll(left, 1, axis=1)  # top coefficient is still zero
+    lip_scale = np.prod(1 / (1 - reflection[:, i_nose:]), axis=1, keepdims=True)
+
+    # Glottis side, as the row vector that maps the waves leaving the nose
+    # junction to the glottal source: [1, -glottal_reflection * q] times the
+    # section and junction matrices of junctions 1 .. i_nose - 1.
+    source_right, source_left = np.zeros((batch, i_nose + 1)), np.zeros((batch, i_nose + 1))
+    source_right[:, 0] = 1
+    source_left[:, 1] = -tract.glottal_reflection
+    for i in range(1, i_nose):
+        r = reflection[:, i - 1:i]
+        source_right, source_left = source_right + r * source_left, r * source_right + source_left
+        source_left = np.roll(source_left, 1, axis=1)
+    glottis_scale = np.prod(1 / (1 - reflection[:, :i_nose - 1]), axis=1, keepdims=True)
+
+    right, left = _polyval(right, powers), _polyval(left, powers)
+    source_right = _polyval(source_right, powers[:i_nose + 1])
+    source_left = _polyval(source_left, powers[:i_nose + 1])
+
+    # Three-way nose junction, the wave returning from the nose eliminated
+    # through the nose's reflectance. ``right`` becomes the wave leaving
+    # towards the glottis times ``returning``, and the left-going wave is
+    # folded into ``source`` directly; both carry the common factor
+    # returning * coupling, which ``output`` shares.
+    nose_reflectance = from_nose / into_nose
+    coupling = 1 - reflection_nose * nose_reflectance
+    into_mouth = (1 + reflection_nose) * nose_reflectance
+    returning = (1 + reflection_right) * (1 + nose_reflectance)
+    right = coupling * (right - reflection_right * left) - (1 + reflection_right) * into_mouth * left
+    source = source_right * coupling * right + source_left * (
+        (reflection_left * coupling + (1 + reflection_left) * into_mouth) * right +
+        (1 + reflection_left) * returning * (1 + nose_reflectance) * left)
+
+    lip_delay = lip_scale * steps ** (n - i_nose)
+    nose = (1 + reflection_nose) * (returning * left + right) * (lip_delay / into_nose)
+    output = returning * coupling + nose
+    return output / (source * lip_delay * glottis_scale * steps ** i_nose)
+
+
+def _polyval(coefficients: np.ndarray, powers: np.ndarray) -> np.ndarray:
+    # Real polynomials (batch, k) at the points whose powers are the rows of
+    # ``powers`` (k, points): one real matrix product over interleaved parts.
+    return (coefficients @ powers.view(float)).view(complex)
+
+
+def _nose_chain(tract: Tract, advance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Waves leaving into (nose_junc_outR[0]) and returning from (noseL[0]) the
+    # nose at its junction, for noseR[nose_length - 1] = 1. The nose is not
+    # damped and its reflections never change after Tract.__init__.
+    right = np.ones_like(advance)
+    left = right * tract.lip_reflection
+    delay = 1 / advance
+    for j in range(tract.nose_length - 1, 0, -1):
+        out_right, in_left = right * advance, left * delay
+        r = tract.nose_reflection[j]
+        right, left = (out_right + r * in_left) / (1 - r), (r * out_right + in_left) / (1 - r)
+    return right * advance, left * delay
+
+
+@lru_cache(maxsize=1)
+def _default_tract() -> Tract:
+    return Tract(44100)
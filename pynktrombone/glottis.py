@@ -1,13 +1,24 @@
+from functools import lru_cache
 from math import exp, sin, log, sqrt
-from random import random
+from typing import Tuple
+
+import numpy as np
 
 from pynktrombone import voc
 
+# The LF pulse shape depends only on tenseness; frequency merely scales the
+# period. Coefficients are cached per quantized tenseness so steady voices skip
+# the derivation at every period.
+TENSENESS_STEPS = 1000000
+WAVEFORM_CACHE_SIZE = 1024
+
+
 class Glottis:
 
-    def __init__(self, sr: float):
+    def __init__(self, sr: float, rng: np.random.Generator = None):
         self.freq: float = 140  # 140Hz frequency by default
         self.tenseness: float = 0.6  # value between 0 and 1
+        self.enable: bool = True  # a disabled glottis is silent and its clock stands still
         self.Rd: float
         self.waveform_length: float
         self.time_in_waveform: float = 0
@@ -19,6 +30,10 @@ class Glottis:
         self.Te: float
         self.omega: float
         self.T: float = 1.0 / sr  # big T
+        # Aspiration noise source. Drawing one value per sample keeps the stream
+        # identical whether it is consumed per sample or in blocks.
+        self.rng: np.random.Generator = rng if rng is not None else np.random.default_rng()
+        self._times: np.ndarray = voc.zeros(513)  # scratch for compute_block
 
         self.setup_waveform(0)
 
@@ -29,75 +44,19 @@ class Glottis:
     # static void glottis_setup_waveform(Glottis *self, SPFLOAT lmbd)
     # CHANGE: self is not a pointer, is returned from fn
     def setup_waveform(self, lmbd: float):
-        Rd: float
-        Ra: float
-        Rk: float
-        Rg: float
-
-        Ta: float
-        Tp: float
-        Te: float
-
-        epsilon: float
-        shift: float
-        delta: float
-        rhs_integral: float
-
-        lower_integral: float
-        upper_integral: float
-
-        omega: float
-        s: float
-        y: float
-        z: float
-
-        alpha: float
-        E0: float
-
         self.Rd = 3 * (1 - self.tenseness)
         self.waveform_length = 1.0 / self.freq
 
-        Rd = self.Rd
-        if (Rd < 0.5): Rd = 0.5
-        if (Rd > 2.7): Rd = 2.7
-
-        Ra = -0.01 + 0.048 * Rd
-        Rk = 0.224 + 0.118 * Rd
-        Rg = (Rk / 4) * (0.5 + 1.2 * Rk) / (0.11 * Rd - Ra * (0.5 + 1.2 * Rk))
-
-        Ta = Ra
-        Tp = float(1.0 / (2 * Rg))
-        Te = Tp + Tp * Rk
-
-        epsilon = float(1.0 / Ta)
-        shift = exp(-epsilon * (1 - Te))
-        delta = 1 - shift
-
-        rhs_integral = float((1.0 / epsilon) * (shift - 1) + (1 - Te) * shift)
-        rhs_integral = rhs_integral / delta
-        lower_integral = - (Te - Tp) / 2 + rhs_integral
-        upper_integral = -lower_integral
-
-        omega = voc.M_PI / Tp
-        s = sin(omega * Te)
-
-        y = -voc.M_PI * s * upper_integral / (Tp * 2)
-        z = log(y)
-        alpha = z / (Tp / 2 - Te)
-        E0 = -1 / (s * exp(alpha * Te))
-
-        self.alpha = alpha
-        self.E0 = E0
-        self.epsilon = epsilon
-        self.shift = shift
-        self.delta = delta
-        self.Te = Te
-        self.omega = omega
+        (self.alpha, self.E0, self.epsilon, self.shift,
+         self.delta, self.Te, self.omega) = waveform_coefficients(
+            round(self.tenseness * TENSENESS_STEPS))
 
     # static SPFLOAT glottis_compute(sp_data *sp, Glottis *self, SPFLOAT lmbd)
     # CHANGE: sp is not a pointer, is returned from fn
     # CHANGE: self is not a pointer, is returned from fn
     def compute(self, lmbd: float) -> float:
+        if not self.enable:
+            return 0.0
         intensity: float = 1.0
 
         self.time_in_waveform += self.T
@@ -113,7 +72,7 @@ class Glottis:
         else:
             out = self.E0 * exp(self.alpha * t) * sin(self.omega * t)
 
-        noise = 2.0 * random() - 1
+        noise = 2.0 * self.rng.random() - 1
 
         aspiration = intensity * (1 - sqrt(self.tenseness)) * 0.3 * noise
 
@@ -122,3 +81,116 @@ class Glottis:
         out += aspiration
 
         return out
+
+    def compute_block(self, out: np.ndarray, lmbd: float = 0) -> None:
+        """Fill ``out`` with consecutive glottis samples, one pitch period at a time.
+
+        Produces the same sequence as calling :meth:`compute` ``len(out)`` times:
+        the waveform clock is advanced with a running sum so wrap points land on
+        the same samples, and each period segment is evaluated with vectorized
+        math. Differences are limited to the last ulp of NumPy's exp/sin.
+        """
+        if not self.enable:
+            out.fill(0.0)
+            return
+        intensity: float = 1.0
+        n = out.shape[0]
+        if self._times.shape[0] < n + 1:
+            self._times = voc.zeros(n + 1)
+
+        time = self.time_in_waveform
+        pos = 0
+        while pos < n:
+            remaining = n - pos
+            times = self._times[:remaining + 1]
+            times[0] = time
+            times[1:] = self.T
+            np.cumsum(times, out=times)
+            times = times[1:]
+
+            wrapped = times > self.waveform_length
+            k = int(np.argmax(wrapped)) if wrapped.any() else remaining
+            if k:
+                self._pulse(times[:k], out[pos:pos + k])
+                time = times[k - 1]
+                pos += k
+
+            if k < remaining:
+                time = times[k] - self.waveform_length
+                self.setup_waveform(lmbd)
+                times[k] = time
+                self._pulse(times[k:k + 1], out[pos:pos + 1])
+                pos += 1
+        self.time_in_waveform = time
+
+        noise = 2.0 * self.rng.random(n) - 1
+        out += intensity * (1 - sqrt(self.tenseness)) * 0.3 * noise * 0.2
+
+    def _pulse(self, times: np.ndarray, out: np.ndarray) -> None:
+        t = times / self.waveform_length
+        np.copyto(out, self.E0 * np.exp(self.alpha * t) * np.sin(self.omega * t))
+        closing = t > self.Te
+        if closing.any():
+            tc = t[closing]
+            out[closing] = (-np.exp(-self.epsilon * (tc - self.Te)) + self.shift) / self.delta
+
+
+@lru_cache(maxsize=WAVEFORM_CACHE_SIZE)
+def waveform_coefficients(tenseness_step: int) -> Tuple[float, ...]:
+    """Shape coefficients (alpha, E0, epsilon, shift, delta, Te, omega) of the LF
+    pulse for tenseness ``tenseness_step / TENSENESS_STEPS``."""
+    Rd: float
+    Ra: float
+    Rk: float
+    Rg: float
+
+    Ta: float
+    Tp: float
+    Te: float
+
+    epsilon: float
+    shift: float
+    delta: float
+    rhs_integral: float
+
+    lower_integral: float
+    upper_integral: float
+
+    omega: float
+    s: float
+    y: float
+    z: float
+
+    alpha: float
+    E0: float
+
+    Rd = 3 * (1 - tenseness_step / TENSENESS_STEPS)
+    if (Rd < 0.5): Rd = 0.5
+    if (Rd > 2.7): Rd = 2.7
+
+    Ra = -0.01 + 0.048 * Rd
+    Rk = 0.224 + 0.118 * Rd
+    Rg = (Rk / 4) * (0.5 + 1.2 * Rk) / (0.11 * Rd - Ra * (0.5 + 1.2 * Rk))
+
+    Ta = Ra
+    Tp = float(1.0 / (2 * Rg))
+    Te = Tp + Tp * Rk
+
+    epsilon = float(1.0 / Ta)
+    shift = exp(-epsilon * (1 - Te))
+    delta = 1 - shift
+
+    rhs_integral = float((1.0 / epsilon) * (shift - 1) + (1 - Te) * shift)
+    rhs_integral = rhs_integral / delta
+    lower_integral = - (Te - Tp) / 2 + rhs_integral
+    upper_integral = -lower_integral
+
+    omega = voc.M_PI / Tp
+    s = sin(omega * Te)
+
+    y = -voc.M_PI * s * upper_integral / (Tp * 2)
+    z = log(y)
+    alpha = z / (Tp / 2 - Te)
+    E0 = -1 / (s * exp(alpha * Te))
+
+    return alpha, E0, epsilon, shift, delta, Te, omega
@@ -1,8 +1,14 @@
+from math import ceil
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 from timeit import timeit
+from typing import Iterable, Iterator, List, Tuple
 import numpy as np
 import soundfile as sf
 
-from pynktrombone.voc import Voc
+from pynktrombone.cache import RenderCache, render_key
+from pynktrombone.timeline import Timeline
+from pynktrombone.voc import DEFAULT_SEED, Voc
 
 
 CHUNK = 512
@@ -15,9 +21,133 @@ class Mouth:
     A wrapper for the Voc class that generates sound files
     from Pink Trombone parameters.
     """
-    def __init__(self, sample_rate=SAMPLE_RATE):
+    def __init__(self, sample_rate=SAMPLE_RATE, backend='reference',
+                 seed=DEFAULT_SEED, cache: RenderCache = None, block_size=CHUNK,
+                 quality='full'):
+        """
+        `block_size` is the Voc block size (and control interval) and the unit
+        render lengths are rounded to. `quality` is one of voc.QUALITIES; use
+        'draft' to screen candidates quickly.
+
+        With a `cache`, every render is a standalone utterance: it is looked up
+        by its parameters, sample rate and `seed`, and on a miss the voice is
+        reset to rest before rendering so identical requests give identical
+        audio. `seed` must then be an int or SeedSequence.
+        """
         self.sample_rate = sample_rate
-        self.vocal = Voc(self.sample_rate)
+        self.backend = backend
+        self.seed = seed
+        self.cache = cache
+        self.block_size = block_size
+        self.quality = quality
+        self.vocal = Voc(sample_rate, backend=backend, seed=seed, block_size=block_size,
+                         quality=quality)
+        # the resting voice, restored by reset instead of building a new Voc
+        self._rest = self.vocal.snapshot()
+        self.reset(seed)
+
+    def reset(self, seed=DEFAULT_SEED) -> None:
+        """
+        Return the voice to its initial resting state with a new noise seed.
+        """
+        self.vocal.restore(self._rest)
+        self.vocal.reseed(seed)
+        # last parameters pushed to the Voc, so unchanged renders skip the setters
+        self._tract_parameters = None
+        self._glottis_parameters = None
+
+    def render(self, trachea=0.5, epiglottis=0.5,
+               velum=0.5, tongue_index=0.5, tongue_diameter=0.5,
+               lips=0.5, glottis_enable=True, glottis_frequency=300,
+               duration=1, out=None) -> np.ndarray:
+        """
+        Render Pink Trombone parameters into a NumPy array.
+
+        The length is rounded up to a whole number of blocks. Parameters are
+        only pushed to the Voc when they differ from the previous render.
+        `out` may be a preallocated float buffer of at least that length.
+        Only touches disk if the Mouth has a cache.
+        """
+        tract_parameters = dict(
+            trachea=trachea,
+            epiglottis=epiglottis,
+            velum=velum,
+            tongue_index=tongue_index,
+            tongue_diameter=tongue_diameter,
+            lips=lips
+        )
+        glottis_parameters = dict(
+            enable=glottis_enable,
+            frequency=glottis_frequency
+        )
+        if self.cache is not None:
+            key = render_key(dict(tract_parameters, **glottis_parameters, duration=duration),
+                             self.sample_rate, seed=self.seed, block_size=self.block_size,
+                             quality=self.quality)
+            audio = self.cache.get(key)
+            if audio is None:
+                self.reset(self.seed)
+                audio = self._render(tract_parameters, glottis_parameters, duration, out)
+                self.cache.put(key, audio)
+            elif out is not None:
+                out[:len(audio)] = audio
+                audio = out[:len(audio)]
+            return audio
+
+        return self._render(tract_parameters, glottis_parameters, duration, out)
+
+    def _render(self, tract_parameters, glottis_parameters, duration, out):
+        if tract_parameters != self._tract_parameters:
+            self.vocal.set_tract_parameters(**tract_parameters)
+            self._tract_parameters = tract_parameters
+        if glottis_parameters != self._glottis_parameters:
+            self.vocal.set_glottis_parameters(**glottis_parameters)
+            self._glottis_parameters = glottis_parameters
+
+        n_samples = render_length(duration, self.sample_rate, self.block_size)
+        return self.vocal.render(n_samples, out=out)
+
+    def render_timeline(self, timeline: Timeline, duration=None, out=None) -> np.ndarray:
+        """
+        Render a keyframed articulation, e.g. a multi-phoneme word, in one pass.
+
+        The timeline is compiled once into per-period control arrays. `duration`
+        defaults to the timeline's and, like in render, is rounded up to whole
+        blocks. With a cache, works like render.
+        """
+        if duration is None:
+            duration = timeline.duration
+        if self.cache is not None:
+            key = render_key(dict(timeline=timeline.keyframes, duration=duration),
+                             self.sample_rate, seed=self.seed, block_size=self.block_size,
+                             quality=self.quality)
+            audio = self.cache.get(key)
+            if audio is None:
+                self.reset(self.seed)
+                audio = self._render_timeline(timeline, duration, out)
+                self.cache.put(key, audio)
+            elif out is not None:
+                out[:len(audio)] = audio
+                audio = out[:len(audio)]
+            return audio
+
+        return self._render_timeline(timeline, duration, out)
+
+    def _render_timeline(self, timeline, duration, out):
+        n_samples = render_length(duration, self.sample_rate, self.block_size)
+        controls = timeline.compile(self.sample_rate, self.vocal.control_interval,
+                                    n_samples // self.vocal.control_interval)
+        # the timeline drives the Voc directly, so the next render must push its parameters
+        self._tract_parameters = None
+        self._glottis_parameters = None
+        return self.vocal.render_controls(controls, out=out)
+
+    def say(self, save_path, timeline: Timeline, duration=None) -> None:
+        """
+        Generate a sound file from an articulation timeline.
+        """
+        assert save_path.endswith('.wav'), 'Save path must end with .wav'
+        sf.write(save_path, self.render_timeline(timeline, duration), self.sample_rate)
 
     def speak(self, save_path, trachea=0.5, epiglottis=0.5,
               velum=0.5, tongue_index=0.5, tongue_diameter=0.5,
@@ -28,24 +158,114 @@ class Mouth:
         """
         assert save_path.endswith('.wav'), 'Save path must end with .wav'
 
-        output = []
-        while len(output)*CHUNK < self.sample_rate * duration:
-            self.vocal.set_tract_parameters(
-                trachea=trachea,
-                epiglottis=epiglottis,
-                velum=velum,
-                tongue_index=tongue_index,
-                tongue_diameter=tongue_diameter,
-                lips=lips
-            )
-            self.vocal.set_glottis_parameters(
-                enable=glottis_enable,
-                frequency=glottis_frequency
-            )
-
-            out = [self.vocal.compute()]
-            while self.vocal.counter != 0:
-                out.append(self.vocal.compute())
-            output.append(out)
-
-        sf.write(save_path, np.concatenate(output), self.sample_rate)
+        output = self.render(
+            trachea=trachea,
+            epiglottis=epiglottis,
+            velum=velum,
+            tongue_index=tongue_index,
+            tongue_diameter=tongue_diameter,
+            lips=lips,
+            glottis_enable=glottis_enable,
+            glottis_frequency=glottis_frequency,
+            duration=duration
+        )
+        sf.write(save_path, output, self.sample_rate)
+
+
+def render_length(duration, sample_rate=SAMPLE_RATE, block_size=CHUNK) -> int:
+    """
+    Number of samples Mouth.render produces for `duration` seconds.
+    """
+    return block_size * ceil(sample_rate * duration / block_size)
+
+
+def render_many(param_sets: Iterable[dict], workers=None, chunksize=1,
+                sample_rate=SAMPLE_RATE, backend='block',
+                seed=DEFAULT_SEED, quality='full') -> List[np.ndarray]:
+    """
+    Render many sets of Mouth.render parameters over a process pool.
+
+    Workers render straight into one shared-memory buffer, so no audio is
+    pickled. Returns one array per parameter set, in submission order.
+    Job `i` is seeded with SeedSequence(seed, spawn_key=(i,)) and starts from
+    a resting voice, so its audio does not depend on `workers`, `chunksize`
+    or which worker ran it. Screen with quality='draft' and re-render the
+    best candidates at full quality.
+    """
+    param_sets = list(param_sets)
+    seed = _job_seed_entropy(seed)
+    offsets = np.cumsum([0] + [render_length(p.get('duration', 1), sample_rate)
+                               for p in param_sets])
+    total = int(offsets[-1])
+
+    shm = SharedMemory(create=True, size=max(total, 1) * np.dtype(float).itemsize)
+    try:
+        jobs = [(i, p, int(offsets[i])) for i, p in enumerate(param_sets)]
+        with Pool(workers, initializer=_init_worker,
+                  initargs=(sample_rate, backend, seed, quality, shm.name)) as pool:
+            for _ in pool.imap_unordered(_render_shared_job, jobs, chunksize):
+                pass
+        shared = np.ndarray((total,), dtype=float, buffer=shm.buf)
+        audio = shared.copy()
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return [audio[offsets[i]:offsets[i + 1]] for i in range(len(param_sets))]
+
+
+def iter_render_many(param_sets: Iterable[dict], workers=None, chunksize=1,
+                     sample_rate=SAMPLE_RATE, backend='block',
+                     seed=DEFAULT_SEED, quality='full',
+                     ordered=False) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Streaming form of render_many: yields (index, audio) pairs as renders
+    finish, or in submission order if `ordered`. `param_sets` is consumed
+    lazily and may be unbounded. Seeding is the same as render_many.
+    """
+    seed = _job_seed_entropy(seed)
+    with Pool(workers, initializer=_init_worker,
+              initargs=(sample_rate, backend, seed, quality, None)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(_render_job, enumerate(param_sets), chunksize)
+
+
+def _job_seed_entropy(seed):
+    # Workers derive per-job seeds on their own, so unseeded runs must fix the
+    # entropy in the parent.
+    if seed is None:
+        return np.random.SeedSequence().entropy
+    return seed
+
+
+# Per-process state of render_many/iter_render_many pool workers.
+_worker_mouth = None
+_worker_seed = None
+_worker_shm = None
+
+
+def _init_worker(sample_rate, backend, seed, quality, shm_name):
+    global _worker_mouth, _worker_seed, _worker_shm
+    _worker_mouth = Mouth(sample_rate, backend=backend, seed=seed, quality=quality)
+    _worker_seed = seed
+    _worker_shm = SharedMemory(name=shm_name) if shm_name else None
+
+
+def _render(index, params, out=None) -> np.ndarray:
+    _worker_mouth.reset(np.random.SeedSequence(_worker_seed, spawn_key=(index,)))
+    return _worker_mouth.render(**params, out=out)
+
+
+def _render_job(job) -> Tuple[int, np.ndarray]:
+    index, params = job
+    return index, _render(index, params)
+
+
+def _render_shared_job(job) -> int:
+    index, params, offset = job
+    n_samples = render_length(params.get('duration', 1), _worker_mouth.sample_rate)
+    shared = np.ndarray((n_samples,), dtype=float, buffer=_worker_shm.buf,
+                        offset=offset * np.dtype(float).itemsize)
+    _render(index, params, out=shared)
+    return index
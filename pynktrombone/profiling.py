@@ -0,0 +1,90 @@
+from functools import wraps
+from time import perf_counter
+from typing import Dict
+
+# Instrumented stages: (component of the Voc, method, stage name). The block
+# backend scatters inside Tract.compute_block without calling the per-step
+# methods, so on it the junctions, lips and nose show up as that one stage.
+# The waveguide is the tract itself, or a draft Voc's DraftTract.
+STAGES = (
+    ('glottis', 'compute', 'Glottis.compute'),
+    ('glottis', 'compute_block', 'Glottis.compute_block'),
+    ('waveguide', 'compute_block', 'Tract.compute_block'),
+    ('waveguide', '_calculate_junctions', 'Tract._calculate_junctions'),
+    ('waveguide', '_calculate_lip_output', 'Tract._calculate_lip_output'),
+    ('waveguide', '_calculate_nose_junc_out', 'Tract._calculate_nose_junc_out'),
+    ('waveguide', '_calculate_nose', 'Tract._calculate_nose'),
+    ('tract.tpool', 'inject', 'TransientPool.inject'),
+    ('tract', 'reshape', 'Tract.reshape'),
+    ('waveguide', 'calculate_reflections', 'Tract.calculate_reflections'),
+    ('waveguide', 'calculate_interpolation_tables', 'Tract.calculate_interpolation_tables'),
+)
+
+
+class ProfileStats:
+    """
+    Cumulative wall time (seconds) and call count of every synthesis stage.
+
+    Times are inclusive: TransientPool.inject and the interpolation tables are
+    also counted in Tract.compute_block when it calls them.
+    """
+    def __init__(self):
+        self.time: Dict[str, float] = {name: 0.0 for _, _, name in STAGES}
+        self.calls: Dict[str, int] = {name: 0 for _, _, name in STAGES}
+
+    def reset(self) -> None:
+        # In place: the installed wrappers hold these dicts.
+        for name in self.time:
+            self.time[name] = 0.0
+            self.calls[name] = 0
+
+    def __str__(self):
+        lines = [f'{"stage":<36} {"calls":>9} {"total ms":>10} {"us/call":>9}']
+        for name in sorted(self.time, key=self.time.get, reverse=True):
+            calls = self.calls[name]
+            if calls:
+                seconds = self.time[name]
+                lines.append(f'{name:<36} {calls:>9} {seconds * 1e3:>10.2f} {seconds / calls * 1e6:>9.2f}')
+        return '\n'.join(lines)
+
+
+def instrument(vocal, stats: ProfileStats) -> None:
+    """
+    Time every stage of ``vocal`` into ``stats``.
+
+    Each method is shadowed by a timing wrapper on the component instance, so
+    :func:`uninstrument` restores the plain class methods and a Voc that is not
+    being profiled pays nothing.
+    """
+    for path, method, name in STAGES:
+        component = _component(vocal, path)
+        setattr(component, method, _timed(getattr(component, method), name, stats))
+
+
+def uninstrument(vocal) -> None:
+    for path, method, _ in STAGES:
+        component = _component(vocal, path)
+        if method in vars(component):
+            delattr(component, method)
+
+
+def _component(vocal, path: str):
+    component = vocal
+    for attr in path.split('.'):
+        component = getattr(component, attr)
+    return component
+
+
+def _timed(method, name: str, stats: ProfileStats):
+    time, calls = stats.time, stats.calls
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            time[name] += perf_counter() - start
+            calls[name] += 1
+
+    return timed
@@ -0,0 +1,90 @@
+import struct
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from pynktrombone.cache import render_key
+
+# Binary frames between anthrop's BrowserBackend, server.py and
+# Pink-Trombone/mouth.js, all little-endian: a header of protocol version
+# (uint8), kind (one ASCII byte) and record count (uint16), then the records.
+#   M  render requests: job (uint32) and the phone's PARAMS (float32 each);
+#      the server sends a browser one record per frame
+#   F  finished jobs: job (uint32) and the sound's key in the sound bank
+#      (32 raw bytes of the SHA-256 digest)
+#   S  a browser's recording: one job (uint32), then the WAV file
+PROTOCOL_VERSION = 1
+REQUEST, REPLY, RECORDING = b'M', b'F', b'S'
+# Parameters of a phone in record order, as Mouth.params gives them.
+PARAMS = ('tongue_index', 'tongue_diameter', 'constriction_index', 'constriction_diameter',
+          'duration', 'timeout', 'intensity', 'tenseness', 'frequency')
+HEADER = struct.Struct('<BcH')
+REQUEST_RECORD = np.dtype([('job', '<u4'), ('params', '<f4', (len(PARAMS),))])
+REPLY_RECORD = np.dtype([('job', '<u4'), ('key', 'u1', (32,))])
+RECORDING_JOB = struct.Struct('<I')
+MAX_RECORDS = 0xFFFF
+
+
+def phone_key(params) -> str:
+    """
+    Sound bank key of a phone: the render_key of its parameters as the float32
+    values a request frame carries, so the client and the server agree on it.
+    """
+    values = np.asarray(params, dtype=np.float32).tolist()
+    assert len(values) == len(PARAMS), f'A phone has {len(PARAMS)} parameters, got {len(values)}'
+    return render_key(dict(zip(PARAMS, values)), synth='pink-trombone')
+
+
+def pack_requests(jobs: Sequence[int], params) -> bytes:
+    """
+    Request frame for phones `params`, shape (len(jobs), len(PARAMS)).
+    """
+    records = np.empty(len(jobs), REQUEST_RECORD)
+    records['job'] = jobs
+    records['params'] = params
+    return _header(REQUEST, len(records)) + records.tobytes()
+
+
+def pack_replies(jobs: Sequence[int], keys: Sequence[str]) -> bytes:
+    records = np.empty(len(jobs), REPLY_RECORD)
+    records['job'] = jobs
+    records['key'] = np.frombuffer(b''.join(bytes.fromhex(key) for key in keys), np.uint8).reshape(-1, 32)
+    return _header(REPLY, len(records)) + records.tobytes()
+
+
+def reply_keys(records: np.ndarray) -> list:
+    """Hex keys of the REPLY_RECORD records of a reply frame."""
+    return [key.tobytes().hex() for key in records['key']]
+
+
+def pack_recording(job: int, wav: bytes) -> bytes:
+    return _header(RECORDING, 1) + RECORDING_JOB.pack(job) + wav
+
+
+def unpack(frame: bytes) -> Tuple[bytes, object]:
+    """
+    Kind and contents of a frame: a structured array of REQUEST_RECORD or
+    REPLY_RECORD records, or the job and WAV file of a recording. Raises
+    ValueError for frames this version cannot read.
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError(f'Frame of {len(frame)} bytes is shorter than its header')
+    version, kind, count = HEADER.unpack_from(frame)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f'Protocol version {version} is not {PROTOCOL_VERSION}')
+    if kind == RECORDING:
+        if len(frame) < HEADER.size + RECORDING_JOB.size:
+            raise ValueError(f'S frame of {len(frame)} bytes is shorter than its job')
+        job, = RECORDING_JOB.unpack_from(frame, HEADER.size)
+        return kind, (job, frame[HEADER.size + RECORDING_JOB.size:])
+    if kind not in (REQUEST, REPLY):
+        raise ValueError(f'Unknown frame kind {kind!r}')
+    dtype = REQUEST_RECORD if kind == REQUEST else REPLY_RECORD
+    if len(frame) != HEADER.size + count * dtype.itemsize:
+        raise ValueError(f'{kind.decode()} frame of {len(frame)} bytes does not hold {count} records')
+    return kind, np.frombuffer(frame, dtype, count, HEADER.size)
+
+
+def _header(kind: bytes, count: int) -> bytes:
+    assert count <= MAX_RECORDS, f'At most {MAX_RECORDS} records fit in a frame, got {count}'
+    return HEADER.pack(PROTOCOL_VERSION, kind, count)
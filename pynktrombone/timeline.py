@@ -0,0 +1,173 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from pynktrombone import voc
+from pynktrombone.voc import Voc
+
+# Articulation parameters a Timeline can key, in the order Voc.set_tract_parameters
+# applies them (the tongue overwrites the top of the epiglottis).
+PARAMETERS = ('trachea', 'epiglottis', 'velum', 'tongue_index', 'tongue_diameter',
+              'lips', 'frequency', 'tenseness')
+
+Keyframe = Tuple[float, Dict[str, float]]
+
+# Tract geometry, mirroring Tract.n and the section boundaries used by the
+# Tract.trachea/epiglottis/lips setters and Voc.tongue_shape (blade 10, tip 32, lips 39).
+TRACT_LENGTH = 44
+TONGUE_START, TONGUE_TIP, TONGUE_END = 10, 32, 39
+REGIONS = (
+    ('trachea', slice(0, 6)),
+    ('epiglottis', slice(6, 12)),
+    ('tongue', slice(TONGUE_START, TONGUE_END)),
+    ('lips', slice(39, TRACT_LENGTH)),
+)
+
+
+class Timeline:
+    """
+    Keyframed articulation: a list of ``(time, {parameter: value})`` pairs,
+    with times in seconds and parameters from PARAMETERS.
+
+    Every parameter is a separate track that is linearly interpolated between
+    the keyframes that mention it and held before the first and after the last
+    one. Parameters never keyed are left to the Voc. ``tongue_index`` and
+    ``tongue_diameter`` shape the tongue together and must be keyed together.
+    """
+    def __init__(self, keyframes: Iterable[Keyframe]):
+        self.keyframes: List[Keyframe] = sorted(((float(time), dict(params)) for time, params in keyframes),
+                                                key=lambda keyframe: keyframe[0])
+        self.tracks: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for name in PARAMETERS:
+            keys = [(time, params[name]) for time, params in self.keyframes if name in params]
+            if keys:
+                times, values = zip(*keys)
+                self.tracks[name] = (np.array(times), np.array(values, dtype=float))
+
+        for time, params in self.keyframes:
+            unknown = set(params) - set(PARAMETERS)
+            assert not unknown, f'Unknown timeline parameters {sorted(unknown)}, expected {PARAMETERS}'
+            assert ('tongue_index' in params) == ('tongue_diameter' in params), \
+                f'Keyframe at {time}s must key tongue_index and tongue_diameter together'
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Tuple[float, Dict[str, float]]],
+                      transition: float = 0.05) -> 'Timeline':
+        """
+        Timeline for a sequence of held articulations, e.g. the phonemes of a word.
+
+        Each segment is ``(duration, params)``: its parameters are held for
+        ``duration`` seconds, the last ``transition`` of which glide into the
+        next segment.
+        """
+        keyframes = []
+        start = 0.0
+        for duration, params in segments:
+            keyframes.append((start, params))
+            hold = start + max(duration - transition, 0.0)
+            if hold > start:
+                keyframes.append((hold, params))
+            start += duration
+        if keyframes:
+            keyframes.append((start, keyframes[-1][1]))
+        return cls(keyframes)
+
+    @property
+    def duration(self) -> float:
+        return self.keyframes[-1][0] if self.keyframes else 0.0
+
+    def compile(self, sample_rate: float, control_interval: int = voc.BLOCK_SIZE,
+                n_periods: Optional[int] = None) -> 'Controls':
+        """
+        Sample every track at the start of each control period.
+
+        :param sample_rate: sample rate of the Voc that will play the controls
+        :param control_interval: its control interval in samples
+        :param n_periods: number of periods, by default enough to cover ``duration``
+        """
+        if n_periods is None:
+            n_periods = int(np.ceil(self.duration * sample_rate / control_interval))
+        times = np.arange(n_periods) * (control_interval / sample_rate)
+
+        def track(name):
+            if name not in self.tracks:
+                return None
+            return np.interp(times, *self.tracks[name])
+
+        # Written in the order of Voc.set_tract_parameters, so the tongue
+        # overwrites the top of the epiglottis just as the setters do.
+        target_diameter = np.zeros((n_periods, TRACT_LENGTH))
+        mask = np.zeros(TRACT_LENGTH, dtype=bool)
+        for name, region in REGIONS:
+            if name == 'tongue':
+                values = track('tongue_index')
+                if values is not None:
+                    target_diameter[:, region] = tongue_diameters(values, track('tongue_diameter'))
+                    mask[region] = True
+                continue
+            values = track(name)
+            if values is not None:
+                target_diameter[:, region] = values[:, None]
+                mask[region] = True
+
+        return Controls(target_diameter, mask, track('velum'), track('frequency'), track('tenseness'))
+
+
+class Controls:
+    """
+    A Timeline compiled for one sample rate and control interval: row ``k`` of
+    every array holds the controls for control period ``k``. ``None`` marks a
+    parameter the timeline does not drive. Play with :meth:`Voc.render_controls`.
+    """
+    def __init__(self, target_diameter: np.ndarray, diameter_mask: np.ndarray,
+                 velum: Optional[np.ndarray], frequency: Optional[np.ndarray],
+                 tenseness: Optional[np.ndarray]):
+        self.target_diameter: np.ndarray = target_diameter
+        self.diameter_mask: np.ndarray = diameter_mask
+        self.velum: Optional[np.ndarray] = velum
+        self.frequency: Optional[np.ndarray] = frequency
+        self.tenseness: Optional[np.ndarray] = tenseness
+        self.n_periods: int = target_diameter.shape[0]
+
+        # Periods whose tract targets differ from the previous period's; the
+        # tract only needs to be marked dirty on these.
+        changed = np.ones(self.n_periods, dtype=bool)
+        changed[1:] = (target_diameter[1:] != target_diameter[:-1]).any(axis=1)
+        if velum is not None:
+            changed[1:] |= velum[1:] != velum[:-1]
+        self.changed: np.ndarray = changed
+
+        # Plain Python values, so the per-period apply does no NumPy scalar boxing.
+        self._changed = changed.tolist()
+        self._masked = bool(diameter_mask.any())
+        self._velum = None if velum is None else velum.tolist()
+        self._frequency = None if frequency is None else frequency.tolist()
+        self._tenseness = None if tenseness is None else tenseness.tolist()
+
+    def apply(self, vocal: Voc, k: int) -> None:
+        """Load the controls of period ``k`` into ``vocal``."""
+        if self._changed[k]:
+            tract = vocal.tract
+            if self._masked:
+                np.copyto(tract.target_diameter, self.target_diameter[k], where=self.diameter_mask)
+            if self._velum is not None:
+                tract.velum_target = self._velum[k]
+            tract.dirty = True
+        if self._frequency is not None:
+            vocal.glottis.freq = self._frequency[k]
+        if self._tenseness is not None:
+            vocal.glottis.tenseness = self._tenseness[k]
+
+
+def tongue_diameters(tongue_index: np.ndarray, tongue_diameter: np.ndarray) -> np.ndarray:
+    """
+    Vectorized Voc.set_diameters: the tongue section of the target diameter
+    for every (tongue_index, tongue_diameter) pair, shape (len, 29).
+    """
+    i = np.arange(TONGUE_START, TONGUE_END)
+    t = 1.1 * voc.M_PI * (tongue_index[:, None] - i) / (TONGUE_TIP - TONGUE_START)
+    fixed_tongue_diameter = 2 + (tongue_diameter[:, None] - 2) / 1.5
+    curve = (1.5 - fixed_tongue_diameter) * np.cos(t)
+    curve[:, (i == TONGUE_START - 2) | (i == TONGUE_END - 1)] *= 0.8
+    curve[:, (i == TONGUE_START) | (i == TONGUE_END - 2)] *= 0.94
+    return 1.5 - curve
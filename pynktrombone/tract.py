@@ -5,8 +5,13 @@ from pynktrombone.transient import TransientPool
 
 
 class Tract:
-    def __init__(self, samplerate: float):
-        self.n: int = 44
+    def __init__(self, samplerate: float, control_interval: int = 512,
+                 n: int = 44, oversampling: int = 2):
+        '''
+        :param n: number of tract sections; the nose and tongue tip scale with it
+        :param oversampling: waveguide steps per output sample
+        '''
+        self.n: int = n
 
         self.diameter: np.ndarray = voc.zeros(self.n)  # len = 44
         self.rest_diameter: np.ndarray = voc.zeros(self.n)  # len = 44
@@ -20,11 +25,11 @@ class Tract:
         self.junction_outR: np.ndarray = voc.zeros(self.n + 1)  # len = 44
         self.A: np.ndarray = voc.zeros(self.n)  # len = 44
 
-        self.nose_length: int = 28
+        self.nose_length: int = 28 * n // 44
 
-        self.nose_start: int = 17
+        self.nose_start: int = n - self.nose_length + 1
 
-        self.tip_start: int = 32
+        self.tip_start: int = 32 * n // 44
         self.noseL: np.ndarray = voc.zeros(self.nose_length)  # len = 28
         self.noseR: np.ndarray = voc.zeros(self.nose_length)  # len = 28
         self.nose_junc_outL: np.ndarray = voc.zeros(self.nose_length + 1)  # len = 29
@@ -51,10 +56,39 @@ class Tract:
         self.movement_speed: float = 15
         self.lip_output: float = 0
         self.nose_output: float = 0
-        self.block_time: float = 512.0 / samplerate
+        # Lip plus nose output of the last step of the previous sample. With one
+        # step per sample it is mixed into the next output sample, the same
+        # two-step sum the 2x oversampled tract produces within each sample.
+        self.previous_output: float = 0
+        self.block_time: float = float(control_interval) / samplerate
 
         self.tpool: TransientPool = TransientPool()
+        self.transient_stride: int = 1  # tract sections per transient position
         self.T: float = 1.0 / samplerate
+        self.oversampling: int = oversampling
+        # Per-step loss, so losses per second do not depend on the step rate.
+        self.damping: float = 0.999 ** (2 / oversampling)
+
+        # Set whenever a target changes; cleared by reshape once the tract is at
+        # rest. Code writing target_diameter or velum_target directly must set it.
+        self.dirty: bool = True
+        self._reflections_pending: int = 2
+        self._slow_return: np.ndarray = np.array([
+            0.6 if i < self.nose_start else
+            1.0 if i >= self.tip_start else
+            0.6 + 0.4 * (i - self.nose_start) / (self.tip_start - self.nose_start)
+            for i in range(self.n)])
+
+        # Per-block sub-step tables, see calculate_interpolation_tables.
+        self.reflection_table: np.ndarray = np.zeros((0, self.n + 1))  # 2 * control_interval x 45
+        self.reflection_left_table: np.ndarray = voc.zeros(0)
+        self.reflection_right_table: np.ndarray = voc.zeros(0)
+        self.reflection_nose_table: np.ndarray = voc.zeros(0)
+        self._tables_stale: bool = True
+
+        # Scratch buffers reused by compute_block so the inner loop never allocates.
+        self._w: np.ndarray = voc.zeros(self.n - 1)  # len = 43
+        self._nose_w: np.ndarray = voc.zeros(self.nose_length - 1)  # len = 27
 
         # TODO Pythonify
         for i in range(self.n):
@@ -92,20 +126,22 @@ class Tract:
     # static void tract_calculate_reflections(Tract *self)
     # CHANGE: self is not a pointer, is returned from fn
     def calculate_reflections(self):
-        # TODO refactor rename i
-        i: int
-        _sum: float
-
-        for i in range(self.n):
-            self.A[i] = self.diameter[i] * self.diameter[i]
-            # /* Calculate area from diameter squared*/
-
-        for i in range(1, self.n):
-            self.reflection[i] = self.new_reflection[i]
-            if self.A[i] == 0:
-                self.new_reflection[i] = 0.999  # /* to prevent bad behavior if 0 */
-            else:
-                self.new_reflection[i] = (self.A[i - 1] - self.A[i]) / (self.A[i - 1] + self.A[i])
+        # Two passes after the last change leave reflection == new_reflection,
+        # after which recomputing would reproduce the same coefficients.
+        if not self._reflections_pending:
+            return
+        self._reflections_pending -= 1
+        self._tables_stale = True
+
+        n = self.n
+        A = self.A
+        np.multiply(self.diameter, self.diameter, out=A)
+        # /* Calculate area from diameter squared*/
+
+        self.reflection[1:n] = self.new_reflection[1:n]
+        closed = A[1:] == 0
+        np.divide(A[:-1] - A[1:], A[:-1] + A[1:], out=self.new_reflection[1:n], where=~closed)
+        self.new_reflection[1:n][closed] = 0.999  # /* to prevent bad behavior if 0 */
 
         self.reflection_left = self.new_reflection_left
         self.reflection_right = self.new_reflection_right
@@ -133,17 +169,8 @@ class Tract:
     #     SPFLOAT  lmbd)
     def compute(self, _in: float, lmbd: float) -> None:
 
-        pool = self.tpool  # Python treats this as a reference, so this should be fine.
-        current_size = pool.size
-        n = pool.root
-        for i in range(current_size):
-            amp = n.strength * pow(2, -1.0 * n.exponent * n.time_alive)
-            self.L[n.position] += amp * 0.5
-            self.R[n.position] += amp * 0.5
-            n.time_alive += self.T * 0.5
-            if n.time_alive > n.lifetime:
-                pool.remove(n.id)
-            n = n.next
+        if self.tpool.size:
+            self.tpool.inject(self.L, self.R, self.T / self.oversampling, self.transient_stride)
 
         # TODO: junction_outR[0] doesn't get used until _calculate_lip_output. And it is the only place that _in is used.
         #       Perhaps, it could be moved to later and then the first part of the calculation could be parallelized...
@@ -169,112 +196,212 @@ class Tract:
         self._calculate_nose()
         self.nose_output = self.noseR[self.nose_length - 1]
 
-    def _calculate_nose(self):
-        n = self.nose_length
-
-        # nr = zeros(n)
-        # nl = zeros(n)
-        # for i in range(self.nose_length):
-        #     nr[i] = self.nose_junc_outR[i]
-        #     nl[i] = self.nose_junc_outL[i + 1]
-
-        nr_n = self.nose_junc_outR[:n]
-        nl_n = self.nose_junc_outL[1:n + 1]
+    def calculate_interpolation_tables(self, n_samples: int) -> None:
+        '''Precompute the interpolated reflection coefficients of a block.
 
-        # np.testing.assert_equal(nr, nr_n)
-        # np.testing.assert_equal(nl, nl_n)
+        Row ``k`` of ``reflection_table`` (shape ``(oversampling * n_samples, n + 1)``)
+        holds ``reflection * (1 - lmbd) + new_reflection * lmbd`` for the sub-step
+        ``lmbd = (k / oversampling) / n_samples`` that compute_block runs; the three nose
+        junction vectors hold the matching blend of the junction coefficients.
+        The tables are rebuilt only after calculate_reflections changes them.
+        '''
+        steps = self.oversampling * n_samples
+        lmbd = (np.arange(steps) / self.oversampling) / n_samples
+        inverse = 1 - lmbd
+        table = self.reflection_table
+        if table.shape[0] != steps:
+            table = self.reflection_table = np.empty((steps, self.n + 1))
+        np.multiply(self.reflection, inverse[:, None], out=table)
+        table += self.new_reflection * lmbd[:, None]
+
+        self.reflection_left_table = self.new_reflection_left * inverse + self.reflection_left * lmbd
+        self.reflection_right_table = self.new_reflection_right * inverse + self.reflection_right * lmbd
+        self.reflection_nose_table = self.new_reflection_nose * inverse + self.reflection_nose * lmbd
+        self._tables_stale = False
+
+    def compute_block(self, glottal: np.ndarray, out: np.ndarray) -> None:
+        '''Render a whole block: ``oversampling`` scattering steps per glottal sample.
+
+        This is the block backend of :class:`~pynktrombone.voc.Voc`. It performs
+        exactly the arithmetic of calling :meth:`compute` at ``i / len(out)``,
+        ``(i + 0.5) / len(out)``, ... for every sample ``i`` and mixing the lip and
+        nose outputs, so for the same glottal samples its output is bit-identical to
+        the reference path. The block backend as a whole is not: its glottal source
+        comes from :meth:`Glottis.compute_block`, whose vectorized waveform differs
+        in the last bits, and renders agree with the reference to within
+        ``benchmarks.golden.TOLERANCE`` (1e-9; about 4e-16 measured). All state is
+        bound to locals once per block and every step writes into preallocated
+        buffers, so no temporary arrays or method calls are made per step.
+        Interpolated reflection coefficients are read from the tables built by
+        :meth:`calculate_interpolation_tables`.
+
+        :param glottal: glottal source samples, one per output sample
+        :param out: buffer receiving ``len(glottal)`` output samples
+        '''
+        n = self.n
+        nose_length = self.nose_length
+        i_nose = self.nose_start
+        n_samples = out.shape[0]
+
+        L, R = self.L, self.R
+        junction_outL, junction_outR = self.junction_outL, self.junction_outR
+        noseL, noseR = self.noseL, self.noseR
+        nose_junc_outL, nose_junc_outR = self.nose_junc_outL, self.nose_junc_outR
+        w, nose_w = self._w, self._nose_w
+
+        steps = self.oversampling
+        if self._tables_stale or self.reflection_table.shape[0] != steps * n_samples:
+            self.calculate_interpolation_tables(n_samples)
+        reflection_table = self.reflection_table[:, 1:n]
+        reflection_left_table = self.reflection_left_table.tolist()
+        reflection_right_table = self.reflection_right_table.tolist()
+        reflection_nose_table = self.reflection_nose_table.tolist()
+
+        # Views used by the scattering junctions; they track in-place updates.
+        R_lo, L_hi = R[:n - 1], L[1:n]
+        jR_mid, jL_mid = junction_outR[1:n], junction_outL[1:n]
+        jR_lo, jL_hi = junction_outR[:n], junction_outL[1:n + 1]
+        nose_reflection = self.nose_reflection[1:nose_length]
+        noseR_lo, noseL_hi = noseR[:nose_length - 1], noseL[1:nose_length]
+        njR_mid, njL_mid = nose_junc_outR[1:nose_length], nose_junc_outL[1:nose_length]
+        njR_lo, njL_hi = nose_junc_outR[:nose_length], nose_junc_outL[1:nose_length + 1]
+
+        glottal_reflection = self.glottal_reflection
+        lip_reflection = self.lip_reflection
+        pool = self.tpool
+        stride = self.transient_stride
+        dt = self.T / steps
+        damping = self.damping
+
+        for i in range(n_samples):
+            _in = glottal[i]
+            vocal_output = 0
+            for k in range(steps * i, steps * i + steps):
+                if pool.size:
+                    pool.inject(L, R, dt, stride)
+
+                junction_outR[0] = L[0] * glottal_reflection + _in
+                junction_outL[n] = R[n - 1] * lip_reflection
+
+                # _calculate_junctions
+                np.add(R_lo, L_hi, out=w)
+                np.multiply(reflection_table[k], w, out=w)
+                np.subtract(R_lo, w, out=jR_mid)
+                np.add(L_hi, w, out=jL_mid)
+
+                rl = reflection_left_table[k]
+                junction_outL[i_nose] = rl * R[i_nose - 1] + (1 + rl) * (noseL[0] + L[i_nose])
+                rr = reflection_right_table[k]
+                junction_outR[i_nose] = rr * L[i_nose] + (1 + rr) * (R[i_nose - 1] + noseL[0])
+                rn = reflection_nose_table[k]
+                nose_junc_outR[0] = rn * noseL[0] + (1 + rn) * (L[i_nose] + R[i_nose - 1])
+
+                # _calculate_lip_output
+                np.multiply(jR_lo, damping, out=R)
+                np.multiply(jL_hi, damping, out=L)
+
+                nose_junc_outL[nose_length] = noseR[nose_length - 1] * lip_reflection
+
+                # _calculate_nose_junc_out
+                np.add(noseR_lo, noseL_hi, out=nose_w)
+                np.multiply(nose_reflection, nose_w, out=nose_w)
+                np.subtract(noseR_lo, nose_w, out=njR_mid)
+                np.add(noseL_hi, nose_w, out=njL_mid)
+
+                # _calculate_nose
+                np.copyto(noseR, njR_lo)
+                np.copyto(noseL, njL_hi)
+
+                vocal_output += R[n - 1] + noseR[nose_length - 1]
+            out[i] = vocal_output * 0.125
+
+        self.lip_output = R[n - 1]
+        self.nose_output = noseR[nose_length - 1]
+        if steps == 1:
+            # Mix in the previous sample's step, as the reference path does per sample.
+            out[1:n_samples] += out[:n_samples - 1].copy()
+            out[0] += self.previous_output * 0.125
+            self.previous_output = vocal_output
 
-        self.noseR[:n] = nr_n
-        self.noseL[:n] = nl_n
+    def _calculate_nose(self):
+        n = self.nose_length
+        self.noseR[:n] = self.nose_junc_outR[:n]
+        self.noseL[:n] = self.nose_junc_outL[1:n + 1]
 
     def _calculate_nose_junc_out(self):
         n = self.nose_length
-
-        # njoR = zeros(n-1)
-        # njoL = zeros(n-1)
-        # for i in range(1, self.nose_length):
-        #     w = self.nose_reflection[i] * (self.noseR[i - 1] + self.noseL[i])
-        #     njoR[i-1] = self.noseR[i - 1] - w
-        #     njoL[i-1] = self.noseL[i] + w
-
-        w_n = self.nose_reflection[1:n] * (self.noseR[:n - 1] + self.noseL[1:n])
-        njoR_n = self.noseR[:n - 1] - w_n
-        njoL_n = self.noseL[1:n] + w_n
-
-        # np.testing.assert_equal(njoR, njoR_n)
-        # np.testing.assert_equal(njoL, njoL_n)
-
-        self.nose_junc_outR[1:n] = njoR_n
-        self.nose_junc_outL[1:n] = njoL_n
+        w = self.nose_reflection[1:n] * (self.noseR[:n - 1] + self.noseL[1:n])
+        self.nose_junc_outR[1:n] = self.noseR[:n - 1] - w
+        self.nose_junc_outL[1:n] = self.noseL[1:n] + w
 
     def _calculate_lip_output(self):
-        # r = zeros(self.n)
-        # l = zeros(self.n)
-        # for i in range(self.n):
-        #     r[i] = self.junction_outR[i] * 0.999
-        #     l[i] = self.junction_outL[i + 1] * 0.999
-
-        r_n = self.junction_outR[:self.n] * 0.999
-        l_n = self.junction_outL[1:self.n + 1] * 0.999
-
-        # np.testing.assert_equal(r, r_n)
-        # np.testing.assert_equal(l, l_n)
-
-        self.R[:self.n] = r_n
-        self.L[:self.n] = l_n
+        self.R[:self.n] = self.junction_outR[:self.n] * self.damping
+        self.L[:self.n] = self.junction_outL[1:self.n + 1] * self.damping
         self.lip_output = self.R[self.n - 1]
 
     def _calculate_junctions(self, lmbd):
-
-        # j_outR = zeros(self.n - 1)
-        # j_outL = zeros(self.n - 1)
-        # for i in range(1, self.n):
-        #     r = self.reflection[i] * (1 - lmbd) + self.new_reflection[i] * lmbd
-        #     w = r * (self.R[i - 1] + self.L[i])
-        #     j_outR[i - 1] = self.R[i - 1] - w
-        #     j_outL[i - 1] = self.L[i] + w
-
         r = self.reflection[1:self.n] * (1 - lmbd) + self.new_reflection[1:self.n] * lmbd
         w = r * (self.R[:self.n - 1] + self.L[1:self.n])
-        j_outR_n = self.R[:self.n - 1] - w
-        j_outL_n = self.L[1:self.n] + w
-
-        # np.testing.assert_equal(j_outR, j_outR_n)
-        # np.testing.assert_equal(j_outL, j_outL_n)
-
-        self.junction_outR[1:self.n] = j_outR_n
-        self.junction_outL[1:self.n] = j_outL_n
+        self.junction_outR[1:self.n] = self.R[:self.n - 1] - w
+        self.junction_outL[1:self.n] = self.L[1:self.n] + w
+
+    def is_silent(self) -> bool:
+        '''True when no transient is sounding and the energy left in the
+        waveguides is below voc.SILENCE_THRESHOLD.'''
+        if self.tpool.size:
+            return False
+        energy = 0.0
+        for rail in (self.L, self.R, self.junction_outL, self.junction_outR,
+                     self.noseL, self.noseR, self.nose_junc_outL, self.nose_junc_outR):
+            energy += np.dot(rail, rail)
+        return energy < voc.SILENCE_THRESHOLD
+
+    def clear(self) -> None:
+        '''Zero the waveguides, so a tract without input stays exactly silent.'''
+        for rail in (self.L, self.R, self.junction_outL, self.junction_outR,
+                     self.noseL, self.noseR, self.nose_junc_outL, self.nose_junc_outR):
+            rail.fill(0.0)
+        self.lip_output = 0.0
+        self.nose_output = 0.0
+        self.previous_output = 0.0
 
     # static void tract_reshape(Tract *self)
     # CHANGE: self is not a pointer, is returned from fn
     def reshape(self) -> None:
-        current_obstruction: int = -1
-        amount = self.block_time * self.movement_speed
-
-        for i in range(self.n):
-            slow_return = 0
-            diameter = self.diameter[i]
-            target_diameter = self.target_diameter[i]
+        # Nothing moved last block and no target changed since: this pass would
+        # leave the geometry and the obstruction state exactly as they are.
+        if not self.dirty:
+            return
 
-            if diameter < 0.001: current_obstruction = i
+        amount = self.block_time * self.movement_speed
+        diameter = self.diameter
+        target_diameter = self.target_diameter
 
-            if i < self.nose_start:
-                slow_return = 0.6
-            elif i >= self.tip_start:
-                slow_return = 1.0
-            else:
-                slow_return = 0.6 + 0.4 * (i - self.nose_start) / (self.tip_start - self.nose_start)
+        obstructed = np.flatnonzero(diameter < 0.001)
+        current_obstruction = int(obstructed[-1]) if obstructed.size else -1
 
-            self.diameter[i] = voc.move_towards(diameter, target_diameter,
-                                                slow_return * amount, 2 * amount)
+        # voc.move_towards, element-wise
+        new_diameter = np.where(diameter < target_diameter,
+                                np.minimum(diameter + self._slow_return * amount, target_diameter),
+                                np.maximum(diameter - 2 * amount, target_diameter))
+        moved = not np.array_equal(new_diameter, diameter)
+        np.copyto(diameter, new_diameter)
 
         if self.last_obstruction > -1 and current_obstruction == -1 and self.noseA[0] < 0.05:
             self.tpool.append(self.last_obstruction)
+        obstruction_changed = current_obstruction != self.last_obstruction
         self.last_obstruction = current_obstruction
 
-        self.nose_diameter[0] = voc.move_towards(self.nose_diameter[0], self.velum_target,
-                                                 amount * 0.25, amount * 0.1)
-        self.noseA[0] = self.nose_diameter[0] * self.nose_diameter[0]
+        nose_diameter = voc.move_towards(self.nose_diameter[0], self.velum_target,
+                                         amount * 0.25, amount * 0.1)
+        noseA = nose_diameter * nose_diameter
+        moved = moved or nose_diameter != self.nose_diameter[0] or noseA != self.noseA[0]
+        self.nose_diameter[0] = nose_diameter
+        self.noseA[0] = noseA
+
+        if moved:
+            self._reflections_pending = 2
+        self.dirty = moved or obstruction_changed
 
     @property
     def lip_start(self):
@@ -303,6 +430,7 @@ class Tract:
     @lips.setter
     def lips(self, d):
         self.target_diameter[self.lip_start:] = d
+        self.dirty = True
 
     @property
     def epiglottis(self):
@@ -311,6 +439,7 @@ class Tract:
     @epiglottis.setter
     def epiglottis(self, d):
         self.target_diameter[self.epiglottis_start:self.blade_start] = d
+        self.dirty = True
 
     @property
     def trachea(self):
@@ -319,3 +448,46 @@ class Tract:
     @trachea.setter
     def trachea(self, d):
         self.target_diameter[:self.epiglottis_start] = d
+        self.dirty = True
+
+
+class DraftTract(Tract):
+    '''Half-resolution waveguide driven by the geometry of a full Tract.
+
+    The full tract runs two waveguide steps per sample over 44 sections, so a
+    wave crosses it in 22 samples. This one runs one step per sample over 22
+    sections: crossing time, and with it the formants, stay put at half the
+    scattering work. Articulation, reshaping and transients stay on ``source``;
+    every time it moves, section pairs are merged into one with their mean
+    area. The nose is fixed, so it is simply built at half resolution, and
+    follows the source's velum.
+    '''
+    def __init__(self, source: Tract, samplerate: float, control_interval: int = 512):
+        super().__init__(samplerate, control_interval, n=source.n // 2, oversampling=1)
+        self.source: Tract = source
+        self.tpool = source.tpool
+        self.transient_stride = source.n // self.n
+        self._follow_source()
+
+    def reshape(self) -> None:
+        source = self.source
+        source.reshape()
+        # The source never calculates its own reflections in draft mode, so its
+        # pending count doubles as "moved since the last sync".
+        if source._reflections_pending:
+            source._reflections_pending = 0
+            self._follow_source()
+        self.dirty = source.dirty
+
+    def _follow_source(self) -> None:
+        source = self.source
+        self.diameter[:] = _merge_pairs(source.diameter[:2 * self.n])
+        self.nose_diameter[0] = source.nose_diameter[0]
+        self.noseA[0] = source.noseA[0]
+        self._reflections_pending = 2
+
+
+def _merge_pairs(diameter: np.ndarray) -> np.ndarray:
+    # Diameter of one section with the mean area of each adjacent pair.
+    area = diameter * diameter
+    return np.sqrt((area[0::2] + area[1::2]) * 0.5)
@@ -1,89 +1,56 @@
-from itertools import count
-from typing import List
+import numpy as np
 
 from pynktrombone import voc
 
 
-class Transient:
-    ids = count(0)
-
-    def __init__(self):
-        self.position: int = 0
-        self.time_alive: float = 0
-        self.lifetime: float
-        self.strength: float = 0
-        self.exponent: float = 0
-        self.is_free: str = 1
-        self.id: int = next(self.ids)
-        self.next: Transient  # PTR
-
-    @classmethod
-    def reset_count(self):
-        self.ids = count(0)
-
-
 class TransientPool:
-    def __init__(self):
-        Transient.reset_count()
+    """
+    Fixed-size pool of decaying plosive transients, stored as parallel arrays.
 
-        self.pool: List[Transient] = []  # Should be limited to MAX_TRANSIENTS
-        self.root: Transient = None  # PTR
+    Slot ``i`` is live while ``active[i]`` is set. ``size`` counts the live
+    slots so callers can skip an empty pool with a single integer test.
+    """
+    def __init__(self):
+        self.position: np.ndarray = np.zeros(voc.MAX_TRANSIENTS, dtype=np.intp)
+        self.time_alive: np.ndarray = voc.zeros(voc.MAX_TRANSIENTS)
+        self.lifetime: np.ndarray = voc.zeros(voc.MAX_TRANSIENTS)
+        self.strength: np.ndarray = voc.zeros(voc.MAX_TRANSIENTS)
+        self.exponent: np.ndarray = voc.zeros(voc.MAX_TRANSIENTS)
+        self.active: np.ndarray = np.zeros(voc.MAX_TRANSIENTS, dtype=bool)
         self.size: int = 0
-        self.next_free: int = 0
-
-        for i in range(voc.MAX_TRANSIENTS):
-            self.pool.append(Transient())
 
     # static int append_transient(TransientPool *self, int position)
-    # CHANGE: self is not a pointer, is returned from fn
+    # CHANGE: linked list replaced by a free slot in the pool arrays
     def append(self, position: int) -> None:
-        i: int
-        free_id: int
-        # Transient *t
-        t: Transient
-
-        free_id = self.next_free
         if self.size == voc.MAX_TRANSIENTS:
             return
 
-        if free_id == -1:
-            for i in range(voc.MAX_TRANSIENTS):
-                if self.pool[i].is_free:
-                    free_id = i
-                    break
-
-        if free_id == -1:
-            return
-
-        t = self.pool[free_id]
-        t.next = self.root
-        self.root = t
+        free_id = int(np.argmin(self.active))
+        self.active[free_id] = True
+        self.time_alive[free_id] = 0
+        self.lifetime[free_id] = 0.2
+        self.strength[free_id] = 0.3
+        self.exponent[free_id] = 200
+        self.position[free_id] = position
         self.size += 1
-        t.is_free = 0
-        t.time_alive = 0
-        t.lifetime = 0.2
-        t.strength = 0.3
-        t.exponent = 200
-        t.position = position
-        self.next_free = -1
-
-    # static void remove_transient(TransientPool *self, unsigned int id)
-    # CHANGE: self is not a pointer, is returned from fn
-    def remove(self, id: int) -> None:
-        i: int
-        n: Transient
-
-        self.next_free = id
-        n = self.root
-        if id == n.id:
-            self.root = n.next
-            self.size -= 1
-            return
 
-        for i in range(self.size):
-            if n.next.id == id:
-                self.size -= 1
-                n.next.is_free = 1
-                n.next = n.next.next
-                break
-            n = n.next
+    def inject(self, L: np.ndarray, R: np.ndarray, dt: float, stride: int = 1) -> None:
+        """Add every live transient into the waveguide rails, then age the pool by ``dt``.
+
+        ``stride`` maps positions onto rails with fewer sections than the tract
+        that placed them. Expired transients are freed, replacing remove_transient.
+        """
+        active = self.active
+        amp = self.strength[active] * np.power(2.0, -1.0 * self.exponent[active] * self.time_alive[active])
+        amp *= 0.5
+        positions = self.position[active]
+        if stride != 1:
+            positions = positions // stride
+        np.add.at(L, positions, amp)
+        np.add.at(R, positions, amp)
+
+        self.time_alive[active] += dt
+        expired = active & (self.time_alive > self.lifetime)
+        if expired.any():
+            active &= ~expired
+            self.size = int(np.count_nonzero(active))
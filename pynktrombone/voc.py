@@ -1,16 +1,19 @@
-import random as rnd
+import asyncio
+import queue
 from enum import Enum
 from math import cos
-from typing import List
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, List, Union
 
 import numpy as np
 
 # from pynkTrombone.glottis import Glottis
 # from pynkTrombone.tract import Tract
 from pynktrombone.glottis import Glottis
-from pynktrombone.tract import Tract
+from pynktrombone.profiling import ProfileStats, instrument, uninstrument
+from pynktrombone.tract import DraftTract, Tract
 
-rnd.seed(a=42)
+if TYPE_CHECKING:
+    from pynktrombone.timeline import Controls
 
 M_PI = 3.14159265358979323846
 
@@ -18,14 +21,125 @@ EPSILON = 1.0e-38
 
 MAX_TRANSIENTS = 4
 
+# Bump whenever a change alters rendered audio; render caches key on it.
+SYNTH_VERSION = 2
+
+# Seed used when a Voc is not given one, so renders stay reproducible by default.
+DEFAULT_SEED = 42
+
+# Render backends selectable on Voc. 'reference' is the sample-by-sample port of
+# the original C code, 'block' renders each control period with
+# Glottis.compute_block and Tract.compute_block. The two agree to within
+# benchmarks.golden.TOLERANCE (1e-9; about 4e-16 measured), not bit for bit.
+BACKENDS = ('reference', 'block')
+
+# Samples per engine block, and per control period unless a Voc sets its own.
+BLOCK_SIZE = 512
+
+# Synthesis quality tiers. 'full' runs the 44-section waveguide twice per sample;
+# 'draft' runs a 22-section DraftTract once per sample, for roughly twice the
+# speed at the spectral error measured by benchmarks.quality.
+QUALITIES = ('full', 'draft')
+
+# Waveguide energy (sum of squares over the rails) below which a tract with a
+# disabled glottis and no transients is treated as silent: its state is zeroed
+# and control periods are filled with zeros without scattering. Leftover
+# samples are then below 1e-9, far under 24-bit resolution.
+SILENCE_THRESHOLD = 1e-18
+
+# Mutable synthesis state packed by Voc.snapshot, per component, in order. Values
+# are stored as float64; the scalars listed in SNAPSHOT_TYPES are converted back
+# on restore. Interpolation tables and scratch buffers are derived, not stored.
+SNAPSHOT_STATE = (
+    ('voc', ('buf', '_counter')),
+    ('glottis', ('enable', 'freq', 'tenseness', 'Rd', 'waveform_length', 'time_in_waveform',
+                 'alpha', 'E0', 'epsilon', 'shift', 'delta', 'Te', 'omega')),
+    ('tract', ('diameter', 'rest_diameter', 'target_diameter', 'new_diameter', 'R', 'L',
+               'reflection', 'new_reflection', 'junction_outL', 'junction_outR', 'A',
+               'noseL', 'noseR', 'nose_junc_outL', 'nose_junc_outR', 'nose_reflection',
+               'nose_diameter', 'noseA', 'reflection_left', 'reflection_right', 'reflection_nose',
+               'new_reflection_left', 'new_reflection_right', 'new_reflection_nose',
+               'velum_target', 'glottal_reflection', 'lip_reflection', 'last_obstruction',
+               'lip_output', 'nose_output', 'dirty', '_reflections_pending')),
+    ('tpool', ('position', 'time_alive', 'lifetime', 'strength', 'exponent', 'active', 'size')),
+)
+# Extra state of a draft Voc's DraftTract, which keeps its own rails and reflections.
+DRAFT_SNAPSHOT_STATE = (
+    ('waveguide', ('diameter', 'R', 'L', 'reflection', 'new_reflection', 'junction_outL',
+                   'junction_outR', 'A', 'noseL', 'noseR', 'nose_junc_outL', 'nose_junc_outR',
+                   'nose_diameter', 'noseA', 'reflection_left', 'reflection_right',
+                   'reflection_nose', 'new_reflection_left', 'new_reflection_right',
+                   'new_reflection_nose', 'lip_output', 'nose_output', 'previous_output',
+                   'dirty', '_reflections_pending')),
+)
+SNAPSHOT_TYPES = {'_counter': int, 'enable': bool, 'last_obstruction': int, 'dirty': bool,
+                  '_reflections_pending': int, 'size': int}
+# The PCG64 noise generator state (128-bit state and increment, buffered uint32)
+# follows as six uint64 words reinterpreted as float64.
+RNG_WORDS = 6
+
 
 class Voc:
     # int sp_voc_init(sp_data *sp, Voc *self)
-    def __init__(self, sr: float = 44100):
-        self.glottis: Glottis = Glottis(sr)
-        self.tract: Tract = Tract(sr)
-        self.buf: np.ndarray = zeros(512)  # len = 512
+    def __init__(self, sr: float = 44100, backend: str = 'reference',
+                 seed: Union[int, np.random.SeedSequence, np.random.Generator] = DEFAULT_SEED,
+                 block_size: int = BLOCK_SIZE, control_interval: int = None,
+                 quality: str = 'full', profile: bool = False):
+        """
+        :param sr: sample rate
+        :param backend: one of BACKENDS
+        :param seed: seed, SeedSequence or Generator for the aspiration noise. The
+            same seed and parameters render identical audio in any thread or
+            process, and the same audio to within ``benchmarks.golden.TOLERANCE``
+            in any VocBatch layout.
+        :param block_size: samples rendered per engine block (``buf``). Small blocks
+            lower the latency of :meth:`compute` and :meth:`stream`.
+        :param control_interval: samples between tract reshapes, over which the
+            reflection coefficients are interpolated. Defaults to ``block_size``
+            and must divide it. Articulator speed in seconds does not depend on it.
+        :param quality: one of QUALITIES. 'draft' roughly halves the cost of a
+            render for screening; ``tract`` still holds the full geometry and
+            ``waveguide`` is the tract that actually scatters.
+        :param profile: start with per-stage profiling on, see :attr:`profile`
+        """
+        if control_interval is None:
+            control_interval = block_size
+        assert backend in BACKENDS, f'Unknown backend {backend!r}, expected one of {BACKENDS}'
+        assert quality in QUALITIES, f'Unknown quality {quality!r}, expected one of {QUALITIES}'
+        assert block_size % control_interval == 0, \
+            f'control_interval {control_interval} must divide block_size {block_size}'
+        self.sr: float = sr
+        self.block_size: int = block_size
+        self.control_interval: int = control_interval
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.glottis: Glottis = Glottis(sr, self.rng)
+        self.tract: Tract = Tract(sr, control_interval)
+        self.quality: str = quality
+        self.waveguide: Tract = DraftTract(self.tract, sr, control_interval) if quality == 'draft' else self.tract
+        self.backend: str = backend
+        self.buf: np.ndarray = zeros(block_size)  # len = block_size
+        self._glottal: np.ndarray = zeros(control_interval)  # len = control_interval
         self._counter: int = 0
+        self.stats: ProfileStats = ProfileStats()
+        self._profile: bool = False
+        self.profile = profile
+
+    @property
+    def profile(self) -> bool:
+        """Whether time and calls of each engine stage are recorded in :attr:`stats`.
+
+        Turning it off removes the instrumentation entirely, so an unprofiled
+        Voc runs at full speed. ``stats.reset()`` clears the counters.
+        """
+        return self._profile
+
+    @profile.setter
+    def profile(self, enabled: bool):
+        if enabled and not self._profile:
+            instrument(self, self.stats)
+        elif not enabled and self._profile:
+            uninstrument(self)
+        self._profile = bool(enabled)
 
     @property
     def frequency(self) -> float:
@@ -129,6 +243,7 @@ class Voc:
     @velum.setter
     def velum(self, t: float):
         self.tract.velum_target = t
+        self.tract.dirty = True
 
     # void sp_voc_set_velum(Voc *self, SPFLOAT velum)
     # {
@@ -145,28 +260,56 @@ class Voc:
     def compute(self) -> float:
 
         if self.counter == 0:
-            self.tract.reshape()
-            self.tract.calculate_reflections()
-            for i in range(512):
-                vocal_output = 0
-                lmbd1 = float(i) / 512.0
-                lmbd2 = float(i + 0.5) / 512.0
-                glot = self.glottis.compute(lmbd1)
-                # sp, self.self, self = glottis_compute(sp, self.self, lmbd1)
-
-                self.tract.compute(glot, lmbd1)
-                # sp, self.self = tract_compute(sp, self.self, glot, lmbd1)
-                vocal_output += self.tract.lip_output + self.tract.nose_output
-
-                self.tract.compute(glot, lmbd2)
-                # sp, self.self = tract_compute(sp, self.self, glot, lmbd2)
-                vocal_output += self.tract.lip_output + self.tract.nose_output
-                self.buf[i] = vocal_output * 0.125
+            self._next_block(self.buf)
 
         out = self.buf[self.counter]
-        self.counter = (self.counter + 1) % 512
+        self.counter = (self.counter + 1) % self.block_size
         return out
 
+    def _next_block(self, buf: np.ndarray) -> None:
+        for start in range(0, self.block_size, self.control_interval):
+            self._next_period(buf[start:start + self.control_interval])
+
+    def _next_period(self, buf: np.ndarray) -> None:
+        self.waveguide.reshape()
+        self.waveguide.calculate_reflections()
+        if not self.glottis.enable and self.waveguide.is_silent():
+            # Pauses and trailing silence: nothing left to scatter.
+            self.waveguide.clear()
+            buf.fill(0.0)
+        elif self.backend == 'block':
+            self._compute_block(buf)
+        else:
+            self._compute_reference(buf)
+
+    def _compute_block(self, buf: np.ndarray) -> None:
+        self.glottis.compute_block(self._glottal)
+        self.waveguide.compute_block(self._glottal, buf)
+
+    def _compute_reference(self, buf: np.ndarray) -> None:
+        tract = self.waveguide
+        draft = tract.oversampling == 1
+        n_samples = len(buf)
+        for i in range(n_samples):
+            vocal_output = 0
+            lmbd1 = float(i) / n_samples
+            lmbd2 = float(i + 0.5) / n_samples
+            glot = self.glottis.compute(lmbd1)
+            # sp, self.self, self = glottis_compute(sp, self.self, lmbd1)
+
+            tract.compute(glot, lmbd1)
+            # sp, self.self = tract_compute(sp, self.self, glot, lmbd1)
+            vocal_output += tract.lip_output + tract.nose_output
+            if draft:
+                buf[i] = (vocal_output + tract.previous_output) * 0.125
+                tract.previous_output = vocal_output
+                continue
+
+            tract.compute(glot, lmbd2)
+            # sp, self.self = tract_compute(sp, self.self, glot, lmbd2)
+            vocal_output += tract.lip_output + tract.nose_output
+            buf[i] = vocal_output * 0.125
+
     # void sp_voc_set_diameters(Voc *self,
     #     int blade_start,
     #     int lip_start,
@@ -196,6 +339,7 @@ class Voc:
             if i == blade_start - 2 or i == lip_start - 1: curve *= 0.8
             if i == blade_start or i == lip_start - 2: curve *= 0.94
             self.tract_diameters[i] = 1.5 - curve
+        self.tract.dirty = True
 
     # void sp_voc_set_tongue_shape(Voc *self,
     #     SPFLOAT tongue_index,
@@ -220,16 +364,214 @@ class Voc:
         self.tongue_shape(tongue_index, tongue_diameter)
         self.tract.lips = lips
 
+    def snapshot(self, out: np.ndarray = None) -> np.ndarray:
+        """Pack all mutable synthesis state into one contiguous float64 array.
+
+        Covers the tract and nose waveguides and geometry, the glottal waveform,
+        the transient pool, the partially played block and the noise generator,
+        so :meth:`restore` resumes rendering bit for bit from this point.
+
+        :param out: optional preallocated array of the snapshot's length
+        """
+        parts = [np.asarray(getattr(component, name), dtype=float).ravel()
+                 for component, names in self._state_components() for name in names]
+        parts.append(_pack_rng(self.rng))
+        return np.concatenate(parts, out=out)
+
+    def restore(self, state: np.ndarray) -> None:
+        """Load a :meth:`snapshot` into this Voc, which must have the same sample
+        rate, block size and control interval as the one it was taken from.
+
+        Arrays are written in place, so views into them (e.g. VocBatch rows) stay valid.
+        """
+        pos = 0
+        for component, names in self._state_components():
+            for name in names:
+                value = getattr(component, name)
+                if isinstance(value, np.ndarray):
+                    value[...] = state[pos:pos + value.size].reshape(value.shape)
+                    pos += value.size
+                else:
+                    setattr(component, name, SNAPSHOT_TYPES.get(name, float)(state[pos]))
+                    pos += 1
+        assert len(state) == pos + RNG_WORDS, \
+            f'Snapshot holds {len(state)} values, this Voc needs {pos + RNG_WORDS}'
+        _unpack_rng(self.rng, state[pos:])
+        self.waveguide._tables_stale = True
+
+    def clone(self, seed: Union[int, np.random.SeedSequence, None] = None) -> 'Voc':
+        """A new Voc in exactly this Voc's current state.
+
+        Useful for keeping pre-warmed voice templates: clone a Voc that has
+        settled on a configuration instead of rendering the warm-up again. The
+        clone continues this Voc's noise stream unless it is given a ``seed``.
+        """
+        twin = Voc(self.sr, backend=self.backend, block_size=self.block_size,
+                   control_interval=self.control_interval, quality=self.quality)
+        twin.restore(self.snapshot())
+        if seed is not None:
+            twin.reseed(seed)
+        return twin
+
+    def reseed(self, seed: Union[int, np.random.SeedSequence]) -> None:
+        """Restart the aspiration noise stream from ``seed``, leaving all other state alone."""
+        self.rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+
+    def _state_components(self):
+        components = dict(voc=self, glottis=self.glottis, tract=self.tract,
+                          tpool=self.tract.tpool, waveguide=self.waveguide)
+        layout = SNAPSHOT_STATE + (DRAFT_SNAPSHOT_STATE if self.quality == 'draft' else ())
+        return [(components[key], names) for key, names in layout]
+
     def play_chunk(self) -> np.ndarray:
         """Play until the next control time.
 
         :return:
         """
-        out = [self.compute()]
-        while self.counter != 0:
-            out.append(self.compute())
+        return self.render(self.block_size - self.counter)
+
+    def render(self, n_samples: int, out: np.ndarray = None) -> np.ndarray:
+        """Render the next ``n_samples`` samples into a float buffer.
+
+        Continues from the current position in the engine block, exactly as
+        ``n_samples`` calls to :meth:`compute` would. Whole blocks are rendered
+        straight into ``out``; only partial blocks go through ``buf``.
+
+        :param n_samples: number of samples to render
+        :param out: optional preallocated buffer of at least ``n_samples`` floats
+        :return: ``out[:n_samples]``, allocated if not given
+        """
+        if out is None:
+            out = zeros(n_samples)
+        assert len(out) >= n_samples, f'Output buffer holds {len(out)} samples, need {n_samples}'
+
+        block_size = self.block_size
+        pos = 0
+        while pos < n_samples:
+            if self.counter == 0 and n_samples - pos >= block_size:
+                self._next_block(out[pos:pos + block_size])
+                pos += block_size
+                continue
+
+            if self.counter == 0:
+                self._next_block(self.buf)
+            take = min(block_size - self.counter, n_samples - pos)
+            out[pos:pos + take] = self.buf[self.counter:self.counter + take]
+            self.counter = (self.counter + take) % block_size
+            pos += take
+
+        return out[:n_samples]
+
+    def render_controls(self, controls: 'Controls', out: np.ndarray = None) -> np.ndarray:
+        """Render one control period per row of compiled timeline controls.
+
+        Each period's controls are loaded straight into the tract and glottis
+        state, without going through the setters. Must start on a block
+        boundary; ``controls`` must be compiled for this Voc's sample rate and
+        control interval.
+
+        :param controls: a :class:`~pynktrombone.timeline.Controls` from ``Timeline.compile``
+        :param out: optional preallocated buffer of at least
+            ``controls.n_periods * control_interval`` floats
+        :return: the rendered audio, allocated if ``out`` is not given
+        """
+        assert self.counter == 0, 'render_controls must start on a block boundary'
+        interval = self.control_interval
+        n_samples = controls.n_periods * interval
+        if out is None:
+            out = zeros(n_samples)
+        assert len(out) >= n_samples, f'Output buffer holds {len(out)} samples, need {n_samples}'
 
-        return np.array(out)
+        for k in range(controls.n_periods):
+            controls.apply(self, k)
+            self._next_period(out[k * interval:(k + 1) * interval])
+
+        return out[:n_samples]
+
+    def stream(self, block_size: int = None, control: queue.Queue = None) -> Iterator[np.ndarray]:
+        """Endlessly yield consecutive blocks of ``block_size`` samples.
+
+        Every block is rendered into the same preallocated array, which is what
+        is yielded; copy it if it must outlive the next iteration. Before each
+        block, all pending items of ``control`` are applied with
+        :meth:`apply_control`.
+
+        :param block_size: samples per yielded block, by default the engine's ``block_size``
+        :param control: optional queue of parameter updates, e.g. fed by another thread
+        """
+        block_size = block_size or self.block_size
+        out = zeros(block_size)
+        while True:
+            _drain(control, queue.Empty, self.apply_control)
+            self.render(block_size, out=out)
+            yield out
+
+    async def astream(self, block_size: int = None, control: asyncio.Queue = None) -> AsyncIterator[np.ndarray]:
+        """Asyncio version of :meth:`stream`.
+
+        Blocks are rendered in the loop's default executor so the event loop
+        keeps serving other tasks (e.g. websocket clients) while the Voc works.
+        The yielded array is reused just as in :meth:`stream`.
+        """
+        loop = asyncio.get_running_loop()
+        block_size = block_size or self.block_size
+        out = zeros(block_size)
+        while True:
+            _drain(control, asyncio.QueueEmpty, self.apply_control)
+            await loop.run_in_executor(None, self.render, block_size, out)
+            yield out
+
+    def apply_control(self, update: Union[Callable[['Voc'], None], dict]) -> None:
+        """Apply one control update between blocks.
+
+        ``update`` is either a callable taking this Voc, or a dict mapping Voc
+        attribute or method names to values: properties are assigned (``{'frequency': 220}``)
+        and methods are called with a dict as keyword arguments or any other
+        value as the single argument (``{'set_tract_parameters': {'lips': 0.2}}``).
+        """
+        if callable(update):
+            update(self)
+            return
+
+        for name, value in update.items():
+            attr = getattr(self, name)
+            if not callable(attr):
+                setattr(self, name, value)
+            elif isinstance(value, dict):
+                attr(**value)
+            else:
+                attr(value)
+
+
+def _pack_rng(rng: np.random.Generator) -> np.ndarray:
+    state = rng.bit_generator.state
+    assert state['bit_generator'] == 'PCG64', 'Voc snapshots support PCG64 noise generators only'
+    words = []
+    for value in (state['state']['state'], state['state']['inc']):
+        words += [value >> 64, value & 0xFFFFFFFFFFFFFFFF]
+    words += [state['has_uint32'], state['uinteger']]
+    return np.array(words, dtype=np.uint64).view(np.float64)
+
+
+def _unpack_rng(rng: np.random.Generator, packed: np.ndarray) -> None:
+    words = [int(word) for word in np.ascontiguousarray(packed).view(np.uint64)]
+    rng.bit_generator.state = {
+        'bit_generator': 'PCG64',
+        'state': {'state': words[0] << 64 | words[1], 'inc': words[2] << 64 | words[3]},
+        'has_uint32': words[4],
+        'uinteger': words[5],
+    }
+
+
+def _drain(control, empty, apply) -> None:
+    if control is None:
+        return
+    while True:
+        try:
+            update = control.get_nowait()
+        except empty:
+            return
+        apply(update)
 
 # static SPFLOAT move_towards(SPFLOAT current, SPFLOAT target,
 #         SPFLOAT amt_up, SPFLOAT amt_down)
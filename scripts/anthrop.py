@@ -1,13 +1,21 @@
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 import asyncio
+import copy
+import itertools
+import threading
 import websockets
-import pickle
+from functools import lru_cache
 
 # import seed_handler
 from scripts.reality import World
-from pynktrombone import save_sound
+from pynktrombone.bank import DEFAULT_BANK_DIR, SoundBank
+from pynktrombone.cache import render_key
+from pynktrombone.protocol import (MAX_RECORDS, PARAMS, REPLY, pack_requests,
+                                   phone_key, reply_keys, unpack)
+from pynktrombone.voc import DEFAULT_SEED, SYNTH_VERSION, Voc
 
 
 # Human eyes operate at 60fps -->
@@ -345,8 +353,7 @@ class Person:
         world: the World in which the Person exists
         '''
         # self.mind.get_action()
-        self.speak(world)
-        save_sound()
+        self.speak(world)  # the Mouth's backend stores the sound
 
     def speak(self, world: World) -> None:
         '''
@@ -398,19 +405,19 @@ class Person:
 
 
 class Sound:
-    def __init__(self, directory: str, properties: tuple) -> None:
+    def __init__(self, name: str, properties: tuple,
+                 bank: SoundBank) -> None:
         '''
         Parameters:
-        filename: wave file path
+        name: key of the sound in the bank
         properties: settings
+        bank: SoundBank holding the sound
         '''
-        self.directory = directory
-        self.name = directory.split('/')[1]
+        self.name = name
         self.properties = properties
         self.volume = properties[3]  # intensity used as volume for now
-        # get sound wave from pickle
-        with (open(f'{directory}/{self.name}.pickle', 'rb')) as openfile:
-            self.wave = np.asarray(pickle.load(openfile))
+        # mono int16 or float32 samples, paged in from disk as they are read
+        self.wave = bank.get(name)
 
     def __str__(self):
         return 's:' + self.name[:8]
@@ -437,11 +444,354 @@ class Sound:
         pass
 
 
+# Pink Trombone geometry (Tract.js, 44 sections) used by the parameter mapping.
+TONGUE_INDEX_RANGE = (12, 29)  # blade start + 2, tip start - 3
+TONGUE_DIAMETER_RANGE = (2.05, 3.5)
+TIP_START = 32
+NOSE_START = 17
+NOSE_OFFSET = 0.8
+# Pink Trombone draws the tongue with this grid offset, Voc.set_diameters
+# with none; shifting the diameter by 1.5 * GRID_OFFSET gives the same shape.
+GRID_OFFSET = 1.7
+# Browser defaults for parameters a phone leaves unset.
+DEFAULT_TONGUE = {"index": 12.9, "diameter": 2.43}
+DEFAULT_CONSTRICTION = {"index": 40, "diameter": 3}
+
+
+class BrowserBackend:
+    '''
+    Speaks through Pink Trombone in a browser (Pink-Trombone/mouth.js),
+    relayed by server.py. The browser records in real time.
+
+    Keeps up to pool_size connections to server.py open on an event loop of
+    its own, started on the first phone, and pipelines phones over them:
+    every phone is a job that server.py answers on the connection it came
+    from, so many can be in flight at once. The phones sent together go in
+    one frame per connection (pynktrombone.protocol). Phones already in the
+    sound bank are answered from it without asking server.py.
+    '''
+    def __init__(self, uri: str = None, bank: SoundBank = None,
+                 pool_size: int = 4):
+        self.uri = uri or 'ws://{}:{}'.format(
+            os.getenv('WS_HOST', 'localhost'), os.getenv('WS_PORT', '5678'))
+        # where server.py stores the recordings
+        self.bank = bank if bank is not None else SoundBank(
+            os.getenv('SOUND_BANK', DEFAULT_BANK_DIR))
+        self.pool_size = pool_size
+        self.jobs = itertools.count()
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._connect_lock = None
+        # open connection -> jobs sent on it that are not answered yet
+        self._connections = {}
+        # job -> future of the sound's key
+        self._replies = {}
+        # tasks reading the replies of the open connections
+        self._readers = set()
+
+    def speak(self, mouth: 'Mouth') -> str:
+        '''
+        Sends the phone to the browser and returns the key server.py
+        stored the recording under in the sound bank.
+        '''
+        keys, missing, pending = self._submit([mouth.params()])
+        if pending is not None:
+            keys[missing[0]] = pending.result()[0]
+        return keys[0]
+
+    async def speak_many(self, mouths: list) -> list:
+        '''
+        Sends all the phones at once and returns their keys in order.
+        '''
+        keys, missing, pending = self._submit([m.params() for m in mouths])
+        if pending is not None:
+            for i, key in zip(missing, await asyncio.wrap_future(pending)):
+                keys[i] = key
+        return keys
+
+    def close(self) -> None:
+        '''
+        Closes the connections, waits for their readers to finish and stops
+        the backend's event loop.
+        '''
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def _submit(self, phones: list) -> tuple:
+        # Keys of the phones, the indices of those not in the bank yet, and
+        # the future of their keys from server.py (None if there are none).
+        # Runs on the caller's thread, like every use of the bank.
+        phones = np.asarray(phones, dtype=np.float32).reshape(-1, len(PARAMS))
+        keys = [phone_key(phone) for phone in phones]
+        missing = [i for i, key in enumerate(keys) if key not in self.bank]
+        if not missing:
+            return keys, missing, None
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                daemon=True)
+                self._thread.start()
+        return keys, missing, asyncio.run_coroutine_threadsafe(
+            self._send(phones[missing]), self._loop)
+
+    async def _send(self, phones: np.ndarray) -> list:
+        await self._connect()
+        connections = list(self._connections)
+        jobs = [next(self.jobs) % (1 << 32) for _ in phones]
+        replies = []
+        for job in jobs:
+            reply = self._loop.create_future()
+            self._replies[job] = reply
+            replies.append(reply)
+        try:
+            # one frame per connection, starting where the last phones left off
+            for k in range(min(len(connections), len(jobs))):
+                websocket = connections[(jobs[0] + k) % len(connections)]
+                chosen = slice(k, None, len(connections))
+                for start in range(0, len(jobs[chosen]), MAX_RECORDS):
+                    frame = slice(start, start + MAX_RECORDS)
+                    self._connections[websocket].update(jobs[chosen][frame])
+                    await websocket.send(pack_requests(jobs[chosen][frame],
+                                                       phones[chosen][frame]))
+        except BaseException:
+            # nobody waits for these replies: forget the jobs
+            for pending in self._connections.values():
+                pending.difference_update(jobs)
+            for job, reply in zip(jobs, replies):
+                self._replies.pop(job, None)
+                reply.cancel()
+            raise
+        return await asyncio.gather(*replies)
+
+    async def _connect(self) -> None:
+        # opens the pool, or reopens connections server.py dropped
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            while len(self._connections) < self.pool_size:
+                websocket = await websockets.connect(self.uri)
+                self._connections[websocket] = set()
+                reader = asyncio.ensure_future(self._receive(websocket))
+                self._readers.add(reader)
+                reader.add_done_callback(self._readers.discard)
+
+    async def _receive(self, websocket) -> None:
+        try:
+            async for message in websocket:
+                try:
+                    kind, records = unpack(message)
+                except (TypeError, ValueError) as error:
+                    print(f'dropped message: {error}')
+                    continue
+                if kind != REPLY:
+                    continue
+                for job, key in zip(records['job'].tolist(),
+                                    reply_keys(records)):
+                    self._connections[websocket].discard(job)
+                    reply = self._replies.pop(job, None)
+                    if reply is not None and not reply.done():
+                        reply.set_result(key)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for job in self._connections.pop(websocket):
+                reply = self._replies.pop(job, None)
+                if reply is not None and not reply.done():
+                    reply.set_exception(ConnectionError(
+                        f'Connection to {self.uri} closed before job {job} finished'))
+
+    async def _close(self) -> None:
+        for websocket in list(self._connections):
+            await websocket.close()
+        # their finally fails the replies still pending
+        readers = list(self._readers)
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+
+class VocBackend:
+    '''
+    Speaks with an in-process pynktrombone Voc: no server or browser, and
+    faster than real time. Each phone is rendered from the resting voice, so
+    identical phones give identical sounds and are only rendered once.
+
+    Mapping of the Mouth parameters, following Pink Trombone's say() in
+    Pink-Trombone/index.html and its Tract.js:
+    tongue: index and diameter clamped to the browser's tongue range, then
+            Voc.set_tract_parameters(tongue_index=index,
+            tongue_diameter=diameter - 1.5 * GRID_OFFSET); trachea,
+            epiglottis and lips at their rest values
+    tongue, constriction: each narrows the target diameters around its
+            index like a browser touch (see constrict); a constriction
+            behind the nose start below -NOSE_OFFSET opens the velum to 0.4,
+            otherwise it is 0.01. A zero or missing value keeps the browser
+            default.
+    tenseness: t -> Voc.tenseness = 1 - cos(t * pi / 2), as the browser maps it
+    intensity: output gain, intensity ** 2 * loudness with the browser's
+            loudness = tenseness ** 0.25, ramped up from silence over the
+            duration like the browser after shutUp()
+    frequency: Voc.frequency (Hz)
+    timeout: milliseconds of leading silence, as the browser's setTimeout
+            reads it
+    duration: seconds rendered after the timeout
+
+    Articulation and pitch are set at the start of the phone; the tract then
+    moves at its own speed instead of the browser's linear ramps. Voc has no
+    fricative noise at constrictions, and its formants scale with the sample
+    rate, so keep it at the browser's 44.1 kHz to compare with recordings.
+    '''
+    def __init__(self, sample_rate: int = 44100, seed=DEFAULT_SEED,
+                 bank: SoundBank = None, backend: str = 'block'):
+        self.sample_rate = sample_rate
+        self.seed = seed
+        self.bank = bank if bank is not None else SoundBank(
+            os.getenv('SOUND_BANK', DEFAULT_BANK_DIR))
+        self.vocal = Voc(sample_rate, backend=backend, seed=seed)
+        self._rest = self.vocal.snapshot()
+
+    async def speak_many(self, mouths: list) -> list:
+        '''
+        Renders the phones one after another and returns their keys.
+        '''
+        return [self.speak(mouth) for mouth in mouths]
+
+    def speak(self, mouth: 'Mouth') -> str:
+        '''
+        Renders the phone into the sound bank, like server.py stores
+        browser recordings, and returns its key.
+        '''
+        params = dict(tongue=mouth.tongue, constriction=mouth.constriction,
+                      duration=mouth.duration, timeout=mouth.timeout,
+                      intensity=mouth.intensity, tenseness=mouth.tenseness,
+                      frequency=mouth.frequency)
+        # the engine version keeps sounds rendered by an older engine out
+        key = render_key(params, self.sample_rate,
+                         synth=f'pynktrombone-{SYNTH_VERSION}', seed=self.seed)
+        if key not in self.bank:
+            self.bank.append(key, self.render(**params), self.sample_rate, params)
+        return key
+
+    def render(self, tongue: dict, constriction: dict, duration: float,
+               timeout: float, intensity: float, tenseness: float,
+               frequency: float) -> np.ndarray:
+        '''
+        Returns the phone as int16 samples, like the browser's recordings.
+        '''
+        vocal = self.vocal
+        vocal.restore(self._rest)
+        vocal.reseed(self.seed)
+
+        index = tongue.get("index") or DEFAULT_TONGUE["index"]
+        diameter = tongue.get("diameter") or DEFAULT_TONGUE["diameter"]
+        index, diameter = clamp_tongue(index, diameter)
+        vocal.set_tract_parameters(tongue_index=index,
+                                   tongue_diameter=diameter - 1.5 * GRID_OFFSET)
+        nasal = False
+        for touch in ({"index": index, "diameter": diameter}, constriction):
+            nasal |= constrict(vocal.tract_diameters,
+                               touch.get("index") or DEFAULT_CONSTRICTION["index"],
+                               touch.get("diameter") or DEFAULT_CONSTRICTION["diameter"])
+        vocal.velum = 0.4 if nasal else 0.01
+        tenseness = 1 - np.cos(tenseness * np.pi / 2)
+        vocal.tenseness = tenseness
+        vocal.frequency = frequency
+
+        voiced = vocal.render(int(duration * self.sample_rate))
+        voiced *= np.linspace(0, intensity, len(voiced)) ** 2 * tenseness ** 0.25
+        silence = np.zeros(int(timeout / 1000 * self.sample_rate))
+        audio = np.concatenate((silence, voiced))
+        return (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+
+def clamp_tongue(index: float, diameter: float) -> tuple:
+    '''
+    Limits the tongue to where Pink Trombone's tongue can reach: a narrower
+    tongue reaches further forward and back.
+    '''
+    low, high = TONGUE_DIAMETER_RANGE
+    diameter = min(max(diameter, low), high)
+    inverted = 1 - (diameter - low) / (high - low)
+    straightened = inverted**0.58 - 0.2 * (inverted**2 - inverted)
+    front, back = TONGUE_INDEX_RANGE
+    center, offset = (front + back) / 2, straightened * (back - front) / 2
+    return min(max(index, center - offset), center + offset), diameter
+
+
+def constrict(diameters: np.ndarray, index: float, diameter: float) -> bool:
+    '''
+    Narrows target tract diameters in place around a Pink Trombone touch
+    (Tract.js _updateConstrictions) and returns whether it opens the velum.
+
+    Parameters:
+    diameters: target diameters, e.g. Voc.tract_diameters
+    index: position of the touch along the tract
+    diameter: tract diameter at the touch, negative below the tract floor
+    '''
+    n = len(diameters)
+    nasal = index > NOSE_START and diameter < -NOSE_OFFSET
+    if 2 <= index < n and diameter > -(0.85 + NOSE_OFFSET):
+        narrowest = max(diameter - 0.3, 0)
+        if narrowest < 3:
+            if index < 25:
+                width = 10
+            elif index >= TIP_START:
+                width = 5
+            else:
+                width = 10 - 5 * (index - 25) / (TIP_START - 25)
+            center = int(np.floor(index + 0.5))
+            reach = int(np.ceil(width)) + 1
+            start = center - reach
+            # like the browser, a touch whose reach starts behind the glottis
+            # leaves the tract alone
+            if start >= 0:
+                # every whole section before center + width + 1, as Tract.js
+                # loops; width is fractional on the tongue blade
+                sections = np.arange(start, min(center + reach, n))
+                offset = np.abs(sections - index) - 0.5
+                scale = np.where(offset <= 0, 0,
+                                 np.where(offset > width, 1,
+                                          0.5 * (1 - np.cos(np.pi * offset / width))))
+                current = diameters[sections]
+                diameters[sections] = np.where(
+                    current > narrowest,
+                    narrowest + (current - narrowest) * scale, current)
+    return nasal
+
+
+@lru_cache(maxsize=None)
+def default_backend(name: str):
+    '''
+    The backend of Mouths given none, one per name so that every Mouth
+    shares its connections to server.py (or its Voc).
+
+    Parameters:
+    name: 'voc' for VocBackend, anything else for BrowserBackend
+    '''
+    return VocBackend() if name == 'voc' else BrowserBackend()
+
+
 class Mouth:
     '''
     Capable of holding all parameters of a phone.
     '''
-    def __init__(self):
+    def __init__(self, backend=None):
+        '''
+        Parameters:
+        backend: synthesizer that speaks the phones, BrowserBackend or
+                 VocBackend; by default one shared by every Mouth, chosen
+                 by the MOUTH_BACKEND environment variable ('browser' or
+                 'voc', default browser)
+        '''
+        self.backend = backend if backend is not None \
+            else default_backend(os.getenv('MOUTH_BACKEND', 'browser'))
         self.tongue = {"index": 0, "diameter": 0}
         self.constriction = {"index": 0, "diameter": 0}
         self.timeout = 0
@@ -455,7 +805,7 @@ class Mouth:
               human_audible: bool = False) -> Sound:
         '''
         Prepares the mouth to speak with provided parameters
-        and returns file of sound location.
+        and returns the Sound it makes.
 
         Parameters:
         human_audible: plays sound if True
@@ -467,30 +817,56 @@ class Mouth:
         self.tenseness = tenseness
         self.frequency = frequency
 
-        async def send_socket(mouth: Mouth):
-            async with websockets.connect("ws://localhost:5678") as websocket:
-                await websocket.send(f"M:{mouth}")
-                new_message = await websocket.recv()
-                if new_message[0:2] != 'F:':
-                    new_sound = await websocket.recv()
-                print(new_sound[2:])
-                return Sound(
-                    new_sound[2:],
-                    (self.tongue, self.constriction, self.timeout,
-                        self.intensity, self.tenseness,
-                        self.frequency, self.duration)
-                )
-
-        loop = asyncio.get_event_loop()
-        coroutine = send_socket(self)
-        sound = loop.run_until_complete(coroutine)
-        return sound
+        return Sound(self.backend.speak(self), self.properties(),
+                     self.backend.bank)
+
+    async def speak_many(self, phones: list) -> list:
+        '''
+        Speaks several phones at once and returns their Sounds in order;
+        a BrowserBackend has them all in flight together. The Mouth is left
+        holding the last phone, as after speaking them one by one.
+
+        Parameters:
+        phones: dicts of the arguments of Mouth.speak
+        '''
+        mouths = [self.phone(**phone) for phone in phones]
+        keys = await self.backend.speak_many(mouths)
+        if mouths:
+            self.__dict__.update(mouths[-1].__dict__)
+        return [Sound(key, mouth.properties(), self.backend.bank)
+                for key, mouth in zip(keys, mouths)]
+
+    def phone(self, tongue: float, constriction: float, timeout: float,
+              intensity: float, tenseness: float, frequency: float,
+              human_audible: bool = False) -> 'Mouth':
+        '''
+        Copy of this Mouth holding the provided parameters.
+        '''
+        mouth = copy.copy(self)
+        mouth.tongue = tongue
+        mouth.constriction = constriction
+        mouth.timeout = timeout
+        mouth.intensity = intensity
+        mouth.tenseness = tenseness
+        mouth.frequency = frequency
+        return mouth
+
+    def params(self) -> list:
+        '''
+        The phone's parameters in pynktrombone.protocol.PARAMS order.
+        '''
+        return [self.tongue["index"], self.tongue["diameter"],
+                self.constriction["index"], self.constriction["diameter"],
+                self.duration, self.timeout, self.intensity,
+                self.tenseness, self.frequency]
+
+    def properties(self) -> tuple:
+        return (self.tongue, self.constriction, self.timeout,
+                self.intensity, self.tenseness,
+                self.frequency, self.duration)
 
     def __str__(self):
-        return f'{self.tongue["index"]}|{self.tongue["diameter"]}| \
-                {self.constriction["index"]}|{self.constriction["diameter"]}|\
-                {self.duration}|{self.timeout}|{self.intensity}|\
-                {self.tenseness}|{self.frequency}'
+        return '|'.join(str(value) for value in self.params())
 
 
 # dist = abs(np.random.normal(0, 0.5, size=100))
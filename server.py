@@ -2,12 +2,13 @@ import os
 import sys
 import asyncio
 import subprocess
+import itertools
 import websockets
-import hashlib
-import pickle
-import datetime
-from scipy.io import wavfile
-import numpy as np
+from collections import deque
+
+from pynktrombone.bank import DEFAULT_BANK_DIR, SoundBank, decode_wav
+from pynktrombone.protocol import (PARAMS, RECORDING, REQUEST, pack_replies,
+                                  pack_requests, phone_key, unpack)
 
 PORT = 8080
 
@@ -19,9 +20,35 @@ if __name__ == '__main__':
 
 
 class Server:
-    current_noise = None
-    current_noise_hash = None
-    connected = set()
+    '''
+    Relays render jobs from simulation clients to Pink Trombone browsers
+    (Pink-Trombone/mouth.js) and answers each job's requester only.
+
+    Protocol, in pynktrombone.protocol frames; jobs are uint32 ids:
+    client  -> server  M frame             render requests; a job id need
+                                           only be unique to its client
+    server  -> client  F frame             the jobs' sounds are in the bank
+    browser -> server  "B" (text)          registers as a renderer
+    server  -> browser M frame, 1 record   render, with the server's job id
+    browser -> server  S frame             the recording of that job
+
+    Each browser renders one job at a time; the rest wait in a queue. Jobs
+    for a sound already being rendered wait for that render.
+    '''
+    def __init__(self, bank: SoundBank = None):
+        # decoded recordings, read by anthrop.Sound
+        self.bank = bank if bank is not None else SoundBank(
+            os.getenv('SOUND_BANK', DEFAULT_BANK_DIR))
+        self.connected = set()
+        # server job id -> (key, float32 params) of renders not yet recorded
+        self.jobs = {}
+        # key -> [(client websocket, client job id)] waiting for the sound
+        self.waiting = {}
+        # server job ids waiting for a free browser
+        self.queue = deque()
+        # browser websocket -> server job id it is rendering, or None
+        self.browsers = {}
+        self.job_ids = itertools.count()
 
     def get_port(self):
         return os.getenv('WS_PORT', '5678')
@@ -32,37 +59,115 @@ class Server:
     def start(self):
         return websockets.serve(self.handler, self.get_host(), self.get_port())
 
-    def save_noise(self):
-        fname = f'{Server.current_noise_hash}_{datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}'
-        os.mkdir(f"mouth_sounds/{fname}")
-        with open(f"mouth_sounds/{fname}/{fname}.wav", 'wb') as f:
-            f.write(Server.current_noise)
-        with open(f"mouth_sounds/{fname}/{fname}.pickle", 'wb') as f:
-            sampRate, data = wavfile.read(f"mouth_sounds/{fname}/{fname}.wav")
-            pickle.dump(list(np.delete(data, 1, 1).flatten()), f)
-        return f"mouth_sounds/{fname}"
-
-    async def handler(self, websocket, path):
+    def save_noise(self, key, params, noise):
+        '''
+        Adds a recording to the sound bank under key.
+        '''
+        sample_rate, samples = decode_wav(noise)
+        self.bank.append(key, samples, sample_rate,
+                         dict(zip(PARAMS, params.tolist())))
+
+    async def request(self, websocket, records):
+        '''
+        Handles a client's render requests, answering those already in the
+        bank with one frame.
+        '''
+        jobs, keys = [], []
+        for job, params in zip(records['job'].tolist(), records['params']):
+            key = phone_key(params)
+            if key not in self.bank:
+                # render it, unless a render of the same sound is in flight
+                if key not in self.waiting:
+                    self.waiting[key] = []
+                    job_id = next(self.job_ids) % (1 << 32)
+                    self.jobs[job_id] = (key, params)
+                    self.queue.append(job_id)
+                self.waiting[key].append((websocket, job))
+                continue
+            jobs.append(job)
+            keys.append(key)
+        if jobs:
+            await self.reply(websocket, jobs, keys)
+        await self.dispatch()
+
+    async def record(self, job_id, noise):
+        '''
+        Stores a browser's recording and answers the job's requesters. A
+        recording that cannot be read puts the job back in the queue, so its
+        requesters wait for another render.
+        '''
+        if job_id not in self.jobs:
+            print(f'recording for unknown job {job_id}')
+            return
+        key, params = self.jobs[job_id]
+        try:
+            self.save_noise(key, params, noise)
+        except Exception as error:
+            print(f'bad recording for job {job_id}: {error!r}')
+            self.queue.appendleft(job_id)
+            return
+        del self.jobs[job_id]
+        requesters = {}
+        for websocket, job in self.waiting.pop(key):
+            requesters.setdefault(websocket, []).append(job)
+        for websocket, jobs in requesters.items():
+            await self.reply(websocket, jobs, [key] * len(jobs))
+
+    async def dispatch(self):
+        '''
+        Sends queued jobs to idle browsers.
+        '''
+        for browser in list(self.browsers):
+            while self.queue and self.queue[0] not in self.jobs:
+                self.queue.popleft()  # recorded since it was queued
+            if not self.queue:
+                break
+            if browser in self.browsers and self.browsers[browser] is None:
+                job_id = self.queue.popleft()
+                self.browsers[browser] = job_id
+                try:
+                    await browser.send(pack_requests([job_id], [self.jobs[job_id][1]]))
+                except websockets.ConnectionClosed:
+                    pass  # its handler puts the job back in the queue
+
+    async def reply(self, websocket, jobs, keys):
+        try:
+            await websocket.send(pack_replies(jobs, keys))
+        except websockets.ConnectionClosed:
+            pass  # the requester left; the sounds stay in the bank
+
+    async def handler(self, websocket, path=None):
         self.connected.add(websocket)
-        recvSound = False
-        async for message in websocket:
-            if recvSound:
-                recvSound = False
-                Server.current_noise = message
-                filename = self.save_noise()
-                await asyncio.wait([websocket.send(f'F:{filename}') for websocket in self.connected])
-            elif message[0] == "M":
-                hash = hashlib.sha256()
-                hash.update(message[1:].encode('utf-8'))
-                Server.current_noise_hash = hash.hexdigest()
+        try:
+            async for message in websocket:
+                if message == "B":
+                    self.browsers[websocket] = None
+                    await self.dispatch()
+                    continue
+                if isinstance(message, str):
+                    print(message)
+                    continue
                 try:
-                    await asyncio.wait([ws.send(message) for ws in self.connected])
-                except:
-                    print("oopsie")
-            elif message == "S":
-                recvSound = True
-            else:
-                print(message)
+                    kind, contents = unpack(message)
+                except ValueError as error:
+                    print(f'dropped frame: {error}')
+                    continue
+                if kind == REQUEST:
+                    await self.request(websocket, contents)
+                elif kind == RECORDING:
+                    await self.record(*contents)
+                    if websocket in self.browsers:
+                        self.browsers[websocket] = None
+                        await self.dispatch()
+                else:
+                    print(f'unexpected {kind.decode()} frame')
+        finally:
+            self.connected.discard(websocket)
+            job_id = self.browsers.pop(websocket, None)
+            if job_id is not None:
+                # the browser left mid-render: give the job to another one
+                self.queue.appendleft(job_id)
+                await self.dispatch()
 
 
 async def main():
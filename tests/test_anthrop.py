@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+
+from pynktrombone.voc import Voc
+from scripts.anthrop import NOSE_OFFSET, TIP_START, constrict
+
+
+def tract_js_constrict(diameters, index, diameter):
+    '''Tract.js _updateConstrictions for one touch, loop for loop.'''
+    diameters = list(diameters)
+    if 2 <= index < len(diameters) and diameter > -(0.85 + NOSE_OFFSET):
+        narrowest = max(diameter - 0.3, 0)
+        if narrowest < 3:
+            if index < 25:
+                width = 10
+            elif index >= TIP_START:
+                width = 5
+            else:
+                width = 10 - 5 * (index - 25) / (TIP_START - 25)
+            center = math.floor(index + 0.5)
+            section = center - (math.ceil(width) + 1)
+            while section < center + width + 1 and 0 <= section < len(diameters):
+                offset = abs(section - index) - 0.5
+                if offset <= 0:
+                    scale = 0
+                elif offset > width:
+                    scale = 1
+                else:
+                    scale = 0.5 * (1 - math.cos(math.pi * offset / width))
+                if diameters[section] > narrowest:
+                    diameters[section] = narrowest + (diameters[section] - narrowest) * scale
+                section += 1
+    return np.array(diameters)
+
+
+def test_constrict_matches_tract_js_over_the_whole_tract():
+    rest = Voc().tract_diameters.copy()
+    # every touch from the glottis to the lips, the blade band 25 to TIP_START included
+    for index in np.arange(0, len(rest) + 1, 0.1):
+        for diameter in (-1.7, -0.5, 0.2, 1.5, 3.5):
+            diameters = rest.copy()
+            constrict(diameters, index, diameter)
+            np.testing.assert_allclose(diameters, tract_js_constrict(rest, index, diameter),
+                                       rtol=0, atol=1e-12, err_msg=f'touch at {index:.1f}, {diameter}')